@@ -1,11 +1,19 @@
 import os
 from pathlib import Path
-from flask import Flask, request, jsonify, send_from_directory
-from utils.ocr import ocr_image
+from typing import Optional
+from flask import Flask, request, jsonify
 from utils.pdf import extract_pdf_text_and_pages
-import requests
+from utils.static_assets import StaticAssets
+from utils.singleflight import SingleFlight, request_key
+from utils.resilience import (
+    OPENROUTER_CHAT_URL, UPSTREAM_DEADLINE_SECONDS, CircuitOpenError, UpstreamError, openrouter_client
+)
+from utils.routing import MODEL_TIERS, classify_request, estimate_cost, requested_page, run_cascade
+from utils.sessions import SessionStore
+from utils.preload import freeze_shared_heap, startup_report, static_documents
+from utils.page_store import PageStoreCache
+from werkzeug.security import safe_join
 from dotenv import load_dotenv
-import re
 import time
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -17,12 +25,15 @@ MAX_TOKENS_PER_REQUEST = int(os.getenv('MAX_TOKENS_PER_REQUEST', '300'))
 RATE_LIMIT_CONTACT = os.getenv('RATE_LIMIT_CONTACT', 'ismail.moudden1@gmail.com')
 MAX_REQUESTS_PER_WINDOW = int(os.getenv('MAX_REQUESTS_PER_WINDOW', '5'))
 REQUEST_WINDOW_SECONDS = int(os.getenv('REQUEST_WINDOW_SECONDS', '3600'))
+SINGLEFLIGHT_LOCK_DIR = os.getenv('SINGLEFLIGHT_LOCK_DIR')
 RATE_LIMIT_MESSAGE = (
     "Demo rate limit enforced: only very short prompts and a handful of API calls "
     f"are supported. Please contact {RATE_LIMIT_CONTACT} for extended access."
 )
 _request_window_start = time.time()
 _request_count = 0
+# Questions identiques en vol (même prompt, même modèle) : un seul appel OpenRouter
+upstream_calls = SingleFlight(SINGLEFLIGHT_LOCK_DIR)
 
 
 def estimate_tokens(text: str) -> int:
@@ -48,6 +59,32 @@ def check_request_limit():
     _request_count += 1
     return None
 
+
+def call_chat_completion(data: dict, timeout: float = 60, deadline: Optional[float] = None) -> str:
+    """Appel chat completion OpenRouter, retourne le texte de la réponse"""
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    # Retries, disjoncteur et hedging : voir utils/resilience.py
+    body = openrouter_client.post_json(OPENROUTER_CHAT_URL, headers, data, timeout=timeout, deadline=deadline)
+    return body['choices'][0]['message']['content']
+
+
+def call_tier(tier: str, messages: list, deadline: Optional[float] = None) -> str:
+    """Appel du modèle d'un tier de routage (timeout et plafond de tokens du tier, deadline de la requête)"""
+    config = MODEL_TIERS[tier]
+    data = {
+        "model": config['model'],
+        "messages": messages,
+        "max_tokens": config['max_tokens']
+    }
+    # Questions identiques en vol sur le même modèle : un seul appel
+    return upstream_calls.do(
+        request_key(data),
+        lambda: call_chat_completion(data, timeout=config['timeout'], deadline=deadline)
+    )
+
 SYSTEM_PROMPT = (
     "Tu es un assistant expert en analyse de documents financiers (fonds, private credit, BDC, etc.), mais tu sais aussi traiter d'autres types de documents.\n"
     "\n"
@@ -81,6 +118,65 @@ SYSTEM_PROMPT = (
 )
 
 app = Flask(__name__)
+static_assets = StaticAssets(STATIC_DIR)
+session_store = SessionStore()
+# Pages des PDF déjà vus (hash de contenu) : stockage compact mappé en mémoire, sans re-parsing,
+# et réutilisation des pages inchangées d'une version à l'autre d'un même document
+parsed_documents = PageStoreCache()
+
+def extract_document_text(filename: str, read_bytes) -> Optional[str]:
+    """Extrait le texte d'un document (PDF page par page, texte brut) ; None si ignoré"""
+    filename = filename.lower()
+    content = ""
+    file_start_time = time.time()
+    print(f"📄 Traitement fichier: {filename}")
+    if read_bytes is None:
+        content += f"\n[Static file not found: {filename}]"
+    elif filename.endswith('.pdf'):
+        try:
+            # La lignée par nom de fichier permet de ne ré-extraire que les pages modifiées
+            pages = parsed_documents.get_or_parse(read_bytes(), extract_pdf_text_and_pages, name=filename)
+            for p in pages:
+                content += f"\n[Page {p['page']}]\n{p['text']}"
+            print(f"✅ PDF traité en {time.time() - file_start_time:.2f}s")
+        except Exception as e:
+            print(f"❌ Erreur PDF: {e}")
+            content += f"\n[PDF extraction error: {e}]"
+    elif filename.endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
+        # Désactivé : on ignore les images
+        return None
+    elif filename.endswith('.txt'):
+        content += f"\n[Text file]\n{read_bytes().decode('utf-8', errors='ignore')}"
+    else:
+        content += f"\n[Unsupported file: {filename}]"
+    return content
+
+
+def static_document_text(name: str) -> Optional[str]:
+    """Texte d'un document de static/, extrait une fois puis partagé (voir warm_shared_data)"""
+    static_path = safe_join(str(STATIC_DIR), name)
+    if not static_path or not os.path.isfile(static_path):
+        return extract_document_text(name, None)
+    return static_documents.get_text(
+        static_path,
+        lambda: extract_document_text(name, Path(static_path).read_bytes)
+    )
+
+
+def warm_shared_data():
+    """Précharge les données en lecture seule dans le master Gunicorn (mode --preload)"""
+    with startup_report.phase('static assets'):
+        asset_count = static_assets.preload()
+    with startup_report.phase('static PDFs'):
+        for pdf_path in sorted(STATIC_DIR.glob('*.pdf')):
+            static_document_text(pdf_path.name)
+    with startup_report.phase('vision cache'):
+        from utils.vision import get_vision_analyzer
+        get_vision_analyzer()
+    with startup_report.phase('gc freeze'):
+        freeze_shared_heap()
+    print(f"📦 Données partagées : {len(static_documents)} PDF statiques, "
+          f"{asset_count} assets hashés")
 
 @app.route('/ask', methods=['POST'])
 def ask():
@@ -89,85 +185,45 @@ def ask():
     print('FORM:', request.form)
     
     start_time = time.time()
+    # Budget de latence de toute la requête (extraction, retries, escalade) sous le timeout Gunicorn
+    deadline = time.monotonic() + UPSTREAM_DEADLINE_SECONDS
     files = request.files.getlist('files')
+    # Documents statiques : lus directement sur le disque, sans ré-upload par le client
+    static_files = request.form.getlist('static_files')
     question = request.form.get('question')
-    
-    if not files or not question:
-        return jsonify({'error': 'Missing files or question'}), 400
+    # Session : les tours suivants réutilisent le contexte documentaire sans ré-upload
+    session_id = request.form.get('session_id')
+    session = session_store.get(session_id) if session_id else None
+    has_documents = bool(files or static_files)
 
-    all_contents = []
-    all_pages = []
-    
-    for file in files:
-        filename = file.filename.lower()
-        content = ""
-        file_start_time = time.time()
-        print(f"📄 Traitement fichier: {filename}")
-        if filename.endswith('.pdf'):
-            try:
-                pages = extract_pdf_text_and_pages(file.read())
-                for p in pages:
-                    page_content = f"\n[Page {p['page']}]\n{p['text']}"
-                    content += page_content
-                    all_pages.append({'page': p['page'], 'text': p['text']})
-                print(f"✅ PDF traité en {time.time() - file_start_time:.2f}s")
-            except Exception as e:
-                print(f"❌ Erreur PDF: {e}")
-                content += f"\n[PDF extraction error: {e}]"
-        elif filename.endswith(('.png', '.jpg', '.jpeg', '.bmp', '.tiff')):
-            # Désactivé : on ignore les images
-            continue
-        elif filename.endswith('.txt'):
-            content += f"\n[Text file]\n{file.read().decode('utf-8', errors='ignore')}"
-        else:
-            content += f"\n[Unsupported file: {filename}]"
-        all_contents.append(content)
-
-    full_text = "\n---\n".join(all_contents)
-    
-    # Nouvelle logique : question sur une page précise ?
-    page_match = re.search(r'page[s]?\s*(\d+)', question, re.IGNORECASE)
-    if page_match and all_pages:
-        page_num = int(page_match.group(1))
-        page_text = next((p['text'] for p in all_pages if p['page'] == page_num), None)
-        # Sommaire des pages pour contexte
-        page_summaries = []
-        for p in all_pages:
-            summary = p['text'][:120].replace('\n', ' ').replace('\r', ' ')
-            page_summaries.append(f"Page {p['page']}: {summary}...")
-        summary_text = "\n".join(page_summaries)
-        if page_text:
-            preview = page_text[:300].replace('\n', ' ').replace('\r', ' ')
-            user_prompt = (
-                f"Voici le sommaire des pages du document :\n{summary_text}\n\n"
-                f"Aperçu du texte extrait pour la page {page_num} :\n{preview}\n\n"
-                f"Voici le texte complet de la page {page_num} :\n{page_text}\n\n"
-                f"Question : {question}"
-            )
-        else:
-            user_prompt = f"La page {page_num} n'a pas été trouvée dans le document.\n\nQuestion : {question}"
-    else:
-        user_prompt = f"Voici le contenu des documents :\n{full_text}\n\nQuestion : {question}"
-
-    print(f"📝 Contenu total: {len(full_text)} caractères")
+    if session_id and session is None and not has_documents:
+        return jsonify({
+            'error': 'session_expired',
+            'message': 'Session expired, please resend the documents.'
+        }), 409
+    if not (has_documents or session) or not question:
+        return jsonify({'error': 'Missing files or question'}), 400
 
     request_limit_error = check_request_limit()
     if request_limit_error:
         return jsonify(request_limit_error), 429
 
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "openai/gpt-4-turbo",
-        "messages": [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt}
-        ]
-    }
+    if has_documents:
+        contents = [extract_document_text(file.filename, file.read) for file in files]
+        contents += [static_document_text(name) for name in static_files]
+        full_text = "\n---\n".join(content for content in contents if content is not None)
+        print(f"📝 Contenu total: {len(full_text)} caractères")
+        if session is None:
+            session = session_store.create()
+        # Session enregistrée seulement après une réponse : pas de fichier orphelin en cas de refus
+        session.set_documents(full_text, [file.filename for file in files] + static_files)
+
+    # Préfixe stable (système + documents), historique compacté, question en fin de prompt ;
+    # une question sur une page reçoit l'extrait de la page dans ce dernier message
+    page = requested_page(question)
+    messages = session.build_messages(SYSTEM_PROMPT, question, page)
 
-    estimated_tokens = estimate_tokens(user_prompt)
+    estimated_tokens = sum(estimate_tokens(m['content']) for m in messages) - estimate_tokens(SYSTEM_PROMPT)
     if estimated_tokens > MAX_TOKENS_PER_REQUEST:
         return jsonify({
             'error': 'rate_limited',
@@ -176,43 +232,53 @@ def ask():
             'estimated_tokens': estimated_tokens
         }), 429
     
+    # Routage local : tier rapide pour les lookups, fort pour les analyses. Pour une page,
+    # le modèle lit surtout l'extrait : la taille du document ne compte que pour la fenêtre
+    prompt_tokens = estimate_tokens(messages[-1]['content']) if page is not None else estimated_tokens
+    route = classify_request(question, prompt_tokens, doc_count=len(session.documents),
+                             context_tokens=estimated_tokens)
+    print(f"🧭 Routage: {route.tier} ({', '.join(route.reasons)}) ~{estimate_cost(route.tier, estimated_tokens):.4f}$")
+
     try:
-        resp = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=data,
-            timeout=60
-        )
-        
-        if resp.status_code != 200:
-            return jsonify({'error': 'OpenRouter error', 'details': resp.text}), 500
-
-        answer = resp.json()['choices'][0]['message']['content']
+        answer, tier = run_cascade(route, lambda t, d: call_tier(t, messages, d), deadline=deadline)
+        session.add_exchange(question, answer)
+        session_store.save(session)
         processing_time = time.time() - start_time
         return jsonify({
             'answer': answer,
+            'session_id': session.id,
+            'model': MODEL_TIERS[tier]['model'],
+            'tier': tier,
             'processing_time': processing_time
         })
-        
+
+    except CircuitOpenError as e:
+        response = jsonify({'error': 'OpenRouter unavailable', 'details': str(e)})
+        response.headers['Retry-After'] = str(int(e.retry_after))
+        return response, 503
+    except UpstreamError as e:
+        return jsonify({'error': 'OpenRouter error', 'details': str(e)}), 500
     except Exception as e:
         print(f"❌ Erreur API: {e}")
         return jsonify({'error': f'API error: {str(e)}'}), 500
 
 @app.route('/')
 def serve_landing():
-    return send_from_directory(str(STATIC_DIR), 'landing.html')
+    return static_assets.send_html('landing.html')
 
 @app.route('/<path:path>')
 def serve_static(path):
-    return send_from_directory(str(STATIC_DIR), path)
+    if path.endswith('.html'):
+        return static_assets.send_html(path)
+    return static_assets.send(path)
 
 @app.route('/index')
 def serve_index():
-    return send_from_directory(str(STATIC_DIR), 'index.html')
+    return static_assets.send_html('index.html')
 
 @app.route('/old')
 def serve_old():
-    return send_from_directory(str(STATIC_DIR), 'index.html')
+    return static_assets.send_html('index.html')
 
 @app.route('/health')
 def health_check():
@@ -0,0 +1,23 @@
+import os
+
+# Chargé automatiquement depuis backend/ (Dockerfile), via --config dans le Procfile
+
+# Mode --preload : l'app et les données en lecture seule sont chargées une fois dans le master,
+# puis partagées en copy-on-write avec les workers
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from app import warm_shared_data
+    from utils.preload import startup_report
+    warm_shared_data()
+    server.log.info(startup_report.format())
+
+
+def post_worker_init(worker):
+    # Sans preload, chaque worker importe l'app : rapport par worker
+    if not worker.cfg.preload_app:
+        from utils.preload import startup_report
+        worker.log.info(startup_report.format())
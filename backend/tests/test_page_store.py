@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Tests du stockage compact des pages (buffer UTF-8 + table d'offsets, mmap)
+et de la ré-ingestion incrémentale des nouvelles versions d'un document
+"""
+
+import hashlib
+import io
+import os
+import stat
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+CURRENT_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = CURRENT_DIR.parent
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from PyPDF2 import PageObject, PdfReader, PdfWriter
+
+from utils.page_store import PageStore, PageStoreCache
+from utils.pdf import extract_pdf_text_and_pages
+
+STATIC_DIR = BACKEND_DIR.parent / "static"
+
+PAGES = [
+    {'page': i + 1, 'text': f"Page {i + 1} — rendement net {i},5 % € ✓\n" * (i % 3 + 1)}
+    for i in range(40)
+]
+
+
+@pytest.mark.parametrize('compression', ['none', 'zlib'])
+def test_roundtrip_through_file(tmp_path, compression):
+    """Le fichier relu par mmap restitue exactement les pages"""
+    store = PageStore.from_pages(PAGES, compression)
+    path = tmp_path / 'doc.pages'
+    store.save(path)
+
+    loaded = PageStore.load(path)
+    assert len(loaded) == len(PAGES)
+    assert list(loaded) == PAGES
+    assert loaded[-1] == PAGES[-1]
+    assert loaded.page_text(17) == PAGES[16]['text']
+    assert loaded.page_text(99) is None
+    loaded.close()
+
+
+def test_loaded_store_is_zero_copy(tmp_path):
+    """Sans compression, le texte et les tables sont des vues sur le mmap"""
+    path = tmp_path / 'doc.pages'
+    PageStore.from_pages(PAGES).save(path)
+    loaded = PageStore.load(path)
+    assert isinstance(loaded.data, memoryview)
+    assert isinstance(loaded.page_offsets, memoryview)
+    assert loaded.page_offsets.obj is loaded.data.obj
+    loaded.close()
+
+
+def test_compression_reduces_size():
+    plain = PageStore.from_pages(PAGES, 'none')
+    compressed = PageStore.from_pages(PAGES, 'zlib')
+    assert compressed.nbytes < plain.nbytes
+
+
+def test_compatible_with_ask_usage():
+    """Même usage que la liste de dicts de extract_pdf_text_and_pages"""
+    store = PageStore.from_pages(PAGES)
+    content = "".join(f"\n[Page {p['page']}]\n{p['text']}" for p in store)
+    expected = "".join(f"\n[Page {p['page']}]\n{p['text']}" for p in PAGES)
+    assert content == expected
+
+
+def test_cache_parses_each_document_once(tmp_path):
+    calls = []
+
+    def parse(pdf_bytes, reuse=None):
+        calls.append(pdf_bytes)
+        return PAGES
+
+    cache = PageStoreCache(str(tmp_path), max_open=1)
+    assert list(cache.get_or_parse(b'pdf-a', parse)) == PAGES
+    cache.get_or_parse(b'pdf-a', parse)
+    cache.get_or_parse(b'pdf-b', parse)
+    # Évincé de la LRU mais relu depuis son fichier, sans re-parsing
+    cache.get_or_parse(b'pdf-a', parse)
+    assert calls == [b'pdf-a', b'pdf-b']
+
+    # Un autre worker (autre instance) réutilise les fichiers
+    assert list(PageStoreCache(str(tmp_path)).get_or_parse(b'pdf-a', parse)) == PAGES
+    assert len(calls) == 2
+
+
+def _pdf(*pages) -> bytes:
+    writer = PdfWriter()
+    for page in pages:
+        writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def test_new_version_only_extracts_changed_pages(tmp_path, monkeypatch):
+    """Une nouvelle version ne coûte que ses pages modifiées"""
+    base = PdfReader(str(STATIC_DIR / "financial-analysis.pdf")).pages
+    other = PdfReader(str(STATIC_DIR / "cours1.pdf")).pages
+    v1 = _pdf(*base)
+    v2 = _pdf(base[0], base[1], other[0], *base[3:])
+
+    extracted = []
+    original = PageObject.extract_text
+
+    def counting_extract(page, *args, **kwargs):
+        extracted.append(page)
+        return original(page, *args, **kwargs)
+
+    monkeypatch.setattr(PageObject, 'extract_text', counting_extract)
+    cache = PageStoreCache(str(tmp_path))
+    first = cache.get_or_parse(v1, extract_pdf_text_and_pages, name="factsheet.pdf")
+    assert len(extracted) == len(base)
+
+    extracted.clear()
+    second = cache.get_or_parse(v2, extract_pdf_text_and_pages, name="factsheet.pdf")
+    assert len(extracted) == 1
+    assert [p['text'] for p in second] == [p['text'] for p in extract_pdf_text_and_pages(v2)]
+    assert second.fingerprint(0) == first.fingerprint(0)
+    assert second.fingerprint(2) != first.fingerprint(2)
+
+    versions = cache.lineage("factsheet.pdf")
+    assert [v['previous'] for v in versions] == [None, versions[0]['key']]
+    assert versions[1]['changed_pages'] == [3]
+    assert cache.get_stats()['pages_reused'] == len(base) - 1
+
+
+def test_fingerprints_survive_roundtrip(tmp_path):
+    pages = [dict(p, fingerprint=f"{i:032x}") for i, p in enumerate(PAGES)]
+    path = tmp_path / 'doc.pages'
+    PageStore.from_pages(pages, 'zlib').save(path)
+    loaded = PageStore.load(path)
+    assert loaded.fingerprint(5) == f"{5:032x}"
+    assert loaded.fingerprint_index()[f"{7:032x}"] == 7
+    assert loaded.changed_pages(PageStore.from_pages(PAGES[:-1])) == [PAGES[-1]['page']]
+    # Parseur sans empreintes : aucune page réutilisable
+    assert PageStore.from_pages(PAGES).fingerprint_index() == {}
+    loaded.close()
+
+
+def _key(pdf_bytes: bytes) -> str:
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def test_cache_files_are_private_and_pruned(tmp_path):
+    """Fichiers en 0600, supprimés après expiration puis au-delà de la taille maximale"""
+    def parse(pdf_bytes, reuse=None):
+        return PAGES
+
+    cache = PageStoreCache(str(tmp_path), ttl=3600, max_bytes=10 ** 9)
+    cache.get_or_parse(b'pdf-a', parse, name="a.pdf")
+    cache.get_or_parse(b'pdf-b', parse, name="b.pdf")
+    files = list(tmp_path.glob('*.pages')) + list((tmp_path / 'lineage').glob('*.json'))
+    assert len(files) == 4
+    assert all(stat.S_IMODE(path.stat().st_mode) == 0o600 for path in files)
+
+    # pdf-a expiré (dernier accès ancien), pdf-b encore récent
+    old = time.time() - 7200
+    for path in [tmp_path / f"{_key(b'pdf-a')}.pages", cache._lineage_path("a.pdf")]:
+        os.utime(path, (old, old))
+    cache._prune(force=True)
+    assert [p.stem for p in tmp_path.glob('*.pages')] == [_key(b'pdf-b')]
+    assert cache.lineage("a.pdf") == []
+
+    # Taille maximale : les stores les moins récemment lus partent en premier
+    cache.get_or_parse(b'pdf-c', parse)
+    os.utime(tmp_path / f"{_key(b'pdf-b')}.pages", (old + 3600, old + 3600))
+    cache.max_bytes = (tmp_path / f"{_key(b'pdf-c')}.pages").stat().st_size
+    cache._prune(force=True)
+    assert [p.stem for p in tmp_path.glob('*.pages')] == [_key(b'pdf-c')]
+
+
+def test_undecodable_stream_disables_reuse(monkeypatch):
+    """Un flux non décodable : pas d'empreinte, la page est toujours ré-extraite"""
+    from PyPDF2.generic import EncodedStreamObject
+
+    from utils import pdf
+
+    def unsupported_filter(stream):
+        raise NotImplementedError("filtre non supporté")
+
+    page = PdfReader(str(STATIC_DIR / "financial-analysis.pdf")).pages[0]
+    with monkeypatch.context() as patch:
+        patch.setattr(EncodedStreamObject, 'get_data', unsupported_filter)
+        assert pdf.page_fingerprint(page) is None
+
+    monkeypatch.setattr(pdf, 'page_fingerprint', lambda page, memo=None: None)
+    pdf_bytes = (STATIC_DIR / "financial-analysis.pdf").read_bytes()
+    pages = extract_pdf_text_and_pages(pdf_bytes, reuse=lambda fingerprint: "réutilisé")
+    assert all(p['fingerprint'] is None and p['text'] != "réutilisé" for p in pages)
+
+
+def test_open_stores_respect_fd_limit(tmp_path, monkeypatch):
+    """Un store ouvert garde un descripteur : la LRU reste sous la limite du processus"""
+    resource = pytest.importorskip('resource')
+    monkeypatch.setattr(resource, 'getrlimit', lambda limit: (64, 4096))
+    assert PageStoreCache(str(tmp_path), max_open=1024).max_open == 16
+    assert PageStoreCache(str(tmp_path), max_open=8).max_open == 8
+
+
+def test_shared_resources_are_hashed_once(monkeypatch):
+    """Les ressources communes à toutes les pages (polices) sont hachées une fois par document"""
+    from utils import pdf
+
+    reader = PdfReader(str(STATIC_DIR / "financial-analysis.pdf"))
+    shared_fonts = reader.pages[0]['/Resources'].get('/Font')
+    assert all(page['/Resources'].get('/Font') == shared_fonts for page in reader.pages)
+    font_dict = shared_fonts.get_object()
+
+    hashed = []
+    original = pdf._hash_object
+
+    def counting_hash(obj, digest, memo):
+        if obj is font_dict:
+            hashed.append(obj)
+        return original(obj, digest, memo)
+
+    monkeypatch.setattr(pdf, '_hash_object', counting_hash)
+    memo = {}
+    fingerprints = [pdf.page_fingerprint(page, memo) for page in reader.pages]
+    assert all(fingerprints)
+    assert len(hashed) == 1
+    assert (shared_fonts.idnum, shared_fonts.generation) in memo
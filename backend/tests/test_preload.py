@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tests du démarrage : imports paresseux et données partagées préchargées
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+CURRENT_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = CURRENT_DIR.parent
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from utils.preload import StartupReport, StaticDocumentCache
+
+
+def test_app_import_is_lazy():
+    """Importer l'app ne charge ni Pillow, ni pytesseract, ni le cache vision"""
+    code = (
+        "import sys, app; "
+        "print('loaded=' + ','.join(m for m in ('PIL', 'pytesseract', 'utils.vision') if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=str(BACKEND_DIR), capture_output=True, text=True, check=True
+    )
+    assert 'loaded=\n' in result.stdout
+
+
+def test_static_document_cache(tmp_path):
+    """Le texte est extrait une fois, puis ré-extrait si le fichier change"""
+    path = tmp_path / 'doc.txt'
+    path.write_text('v1')
+    cache = StaticDocumentCache()
+    calls = []
+
+    def extract():
+        calls.append(1)
+        return path.read_text()
+
+    assert cache.get_text(str(path), extract) == 'v1'
+    assert cache.get_text(str(path), extract) == 'v1'
+    assert len(calls) == 1
+
+    path.write_text('v2 plus long')
+    os.utime(path, ns=(0, 0))
+    assert cache.get_text(str(path), extract) == 'v2 plus long'
+    assert len(calls) == 2
+
+
+def test_startup_report():
+    report = StartupReport()
+    with report.phase('import app'):
+        pass
+    text = report.format()
+    assert 'import app' in text
+    assert 'total' in text
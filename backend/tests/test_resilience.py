@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Tests de la couche de résilience des appels amont (retries, disjoncteur, hedging)
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+CURRENT_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = CURRENT_DIR.parent
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from utils import resilience
+from utils.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientClient,
+    UpstreamError,
+    backoff_delay,
+    parse_retry_after,
+)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Capture les attentes de backoff au lieu de dormir"""
+    recorded = []
+    monkeypatch.setattr(resilience.time, 'sleep', recorded.append)
+    return recorded
+
+
+def _failing_then(results):
+    """Fonction d'essai qui lève ou retourne successivement les éléments de `results`"""
+    calls = []
+
+    def send(timeout):
+        item = results[len(calls)]
+        calls.append(item)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    return send, calls
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('7') == 7.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('pas une date') is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+
+
+def test_backoff_honours_retry_after():
+    for attempt in range(5):
+        assert 0 <= backoff_delay(attempt) <= resilience.BACKOFF_MAX_SECONDS
+    assert backoff_delay(0, retry_after=12) >= 12
+
+
+def test_retries_transient_errors(sleeps):
+    """Les 5xx/429 sont retentés avec Retry-After comme plancher"""
+    client = ResilientClient('test', max_retries=3)
+    send, calls = _failing_then([
+        UpstreamError('surcharge', status=429, retry_after=4),
+        UpstreamError('indisponible', status=503),
+        {'ok': True},
+    ])
+    assert client.call(send) == {'ok': True}
+    assert len(calls) == 3
+    assert sleeps[0] >= 4
+    assert client.breaker.state == 'closed'
+
+
+def test_client_errors_are_not_retried(sleeps):
+    """Un 4xx (hors 408/425/429) échoue immédiatement sans toucher au disjoncteur"""
+    client = ResilientClient('test', max_retries=3)
+    send, calls = _failing_then([UpstreamError('clé invalide', status=401)])
+    with pytest.raises(UpstreamError):
+        client.call(send)
+    assert len(calls) == 1
+    assert sleeps == []
+    assert client.breaker.failures == 0
+
+
+def test_retry_budget_fails_fast(sleeps):
+    """Un Retry-After dépassant le budget restant n'immobilise pas le worker"""
+    client = ResilientClient('test', max_retries=3, deadline=5)
+    send, calls = _failing_then([UpstreamError('surcharge', status=429, retry_after=60)])
+    with pytest.raises(UpstreamError):
+        client.call(send)
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_circuit_breaker_opens_and_recovers(monkeypatch):
+    """Le circuit s'ouvre après N échecs, puis laisse passer une sonde"""
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, 'monotonic', lambda: now[0])
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError) as exc_info:
+        breaker.before_call()
+    assert exc_info.value.retry_after == 30
+
+    now[0] += 31
+    breaker.before_call()  # sonde
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # une seule sonde à la fois
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+
+def test_open_circuit_short_circuits_client(sleeps):
+    client = ResilientClient('test', max_retries=1, breaker=CircuitBreaker('test', failure_threshold=1))
+    send, calls = _failing_then([UpstreamError('panne', status=502)])
+    with pytest.raises(UpstreamError):
+        client.call(send)
+    with pytest.raises(CircuitOpenError):
+        client.call(send)
+    assert len(calls) == 1
+
+
+def test_hedged_request_wins():
+    """Au-delà du seuil de latence, une seconde requête part et la plus rapide gagne"""
+    client = ResilientClient('test', max_retries=1, hedge_after=0.05)
+    calls = []
+
+    def send(timeout):
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return 'lente'
+        return 'rapide'
+
+    assert client.call(send) == 'rapide'
+    assert client.get_stats()['hedged_requests'] == 1
+
+
+def test_deadline_bounds_total_time(monkeypatch):
+    """Chaque essai reçoit le temps restant : deux timeouts ne dépassent pas le budget"""
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(resilience.time, 'sleep', lambda delay: now.__setitem__(0, now[0] + delay))
+    monkeypatch.setattr(resilience.random, 'uniform', lambda low, high: high)
+    timeouts = []
+
+    def send(timeout):
+        # L'essai consomme tout son timeout puis expire
+        timeouts.append(timeout)
+        now[0] += timeout
+        raise UpstreamError('Timeout')
+
+    client = ResilientClient('test', max_retries=3, deadline=75)
+    with pytest.raises(UpstreamError):
+        client.call(send, timeout=60)
+    assert timeouts[0] == 60
+    assert timeouts[1] < 60
+    assert now[0] - 1000.0 <= 75
+
+    # Deadline de requête plus courte que le budget du client
+    now[0] = 2000.0
+    timeouts.clear()
+    with pytest.raises(UpstreamError):
+        client.call(send, timeout=60, deadline=2030.0)
+    assert timeouts[0] == 30
+    assert now[0] - 2000.0 <= 30
+
+
+def test_exhausted_deadline_fails_without_calling():
+    client = ResilientClient('test', max_retries=3)
+    send, calls = _failing_then([{'ok': True}])
+    with pytest.raises(UpstreamError):
+        client.call(send, deadline=time.monotonic() + 0.5)
+    assert calls == []
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests du routage des requêtes vers les tiers de modèles
+"""
+
+import sys
+from pathlib import Path
+
+CURRENT_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = CURRENT_DIR.parent
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from utils import routing
+from utils.routing import RouteDecision, classify_request, is_confident, route_vision, run_cascade
+
+
+def test_page_lookup_goes_to_fast_tier():
+    decision = classify_request("Que contient la page 6 ?", prompt_tokens=200)
+    assert decision.tier == 'fast'
+    assert decision.page == 6
+    assert decision.cascade[0] == 'fast'
+
+
+def test_analytic_question_goes_to_strong_tier():
+    decision = classify_request("Analyse la structure des frais du fonds", prompt_tokens=200)
+    assert decision.tier == 'strong'
+    assert decision.cascade == ['strong']
+
+
+def test_multi_document_and_large_prompt():
+    assert classify_request("Quel est l'AUM ?", 200, doc_count=3).tier == 'standard'
+    assert classify_request("Page 2 ?", routing.LARGE_PROMPT_TOKENS + 1).tier == 'standard'
+    huge = routing.MODEL_TIERS['standard']['max_prompt_tokens'] + 1
+    assert classify_request("Quel est l'AUM ?", huge).tier == 'strong'
+
+
+def test_page_lookup_on_large_document_stays_fast():
+    """La taille de l'extrait décide du tier ; celle du document ne compte que pour la fenêtre"""
+    decision = classify_request("Que contient la page 6 ?", prompt_tokens=600, context_tokens=30000)
+    assert decision.tier == 'fast'
+    too_big = routing.MODEL_TIERS['fast']['max_prompt_tokens'] + 1
+    assert classify_request("Page 6 ?", 600, context_tokens=too_big).tier == 'standard'
+
+
+def test_confidence_check():
+    decision = RouteDecision(tier='fast', cascade=['fast', 'strong'], page=6)
+    assert is_confident("**Page 6** : le fonds affiche un net return de 9,8 % sur 12 mois.", decision)
+    assert not is_confident("Non mentionné dans le document.", decision)
+    assert not is_confident("Le fonds affiche un net return de 9,8 % sur douze mois glissants.", decision)
+    # Le numéro de page doit être cité en entier, pas trouvé dans un autre nombre
+    first_page = RouteDecision(tier='fast', cascade=['fast', 'strong'], page=1)
+    assert not is_confident("Le fonds affiche 10 % de rendement en 2019, incentive fee de 12,5 %.", first_page)
+    assert is_confident("D'après la page 1, le fonds affiche 10 % de rendement en 2019.", first_page)
+
+
+def test_cascade_escalates_on_low_confidence():
+    decision = RouteDecision(tier='fast', cascade=['fast', 'strong'], page=3)
+    called = []
+
+    def call_tier(tier, deadline):
+        called.append(tier)
+        if tier == 'fast':
+            return "Je ne sais pas."
+        return "**Page 3** : frais de gestion de 1,25 % par an, incentive fee de 12,5 %."
+
+    answer, tier = run_cascade(decision, call_tier)
+    assert tier == 'strong'
+    assert called == ['fast', 'strong']
+    assert 'Page 3' in answer
+
+
+def test_vision_routing():
+    assert route_vision('chart') == 'vision'
+    assert route_vision('table') == 'vision'
+    assert route_vision('image') == 'vision_fast'
+
+
+def test_cascade_keeps_fast_answer_when_budget_is_short(monkeypatch):
+    """Pas d'escalade si le temps restant ne couvre pas le timeout du tier fort"""
+    now = [100.0]
+    monkeypatch.setattr(routing.time, 'monotonic', lambda: now[0])
+    decision = RouteDecision(tier='fast', cascade=['fast', 'strong'], page=3)
+    deadlines = []
+
+    def call_tier(tier, deadline):
+        deadlines.append(deadline)
+        now[0] += 50
+        return "Je ne sais pas."
+
+    answer, tier = run_cascade(decision, call_tier, deadline=175.0)
+    assert tier == 'fast'
+    assert deadlines == [175.0]
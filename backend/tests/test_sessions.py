@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests des sessions de chat (préfixe stable, compaction de l'historique, stockage)
+"""
+
+import stat
+import sys
+import time
+from pathlib import Path
+
+CURRENT_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = CURRENT_DIR.parent
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from utils import sessions
+from utils.sessions import ChatSession, SessionStore
+
+
+def test_prefix_is_stable_across_turns():
+    """Le premier message (système + documents) ne change pas d'un tour à l'autre"""
+    session = ChatSession('s' * 24, document_context="[Page 1]\nNet return 9,8 %")
+    first = session.build_messages("SYSTEM", "Quel est le net return ?")
+    session.add_exchange("Quel est le net return ?", "9,8 % (page 1).")
+    second = session.build_messages("SYSTEM", "Et sur 3 ans ?")
+
+    assert first[0] == second[0]
+    assert "Net return 9,8 %" in second[0]['content']
+    assert second[-1] == {"role": "user", "content": "Et sur 3 ans ?"}
+    assert second[1:3] == [
+        {"role": "user", "content": "Quel est le net return ?"},
+        {"role": "assistant", "content": "9,8 % (page 1)."},
+    ]
+
+
+def test_page_question_puts_excerpt_after_stable_prefix():
+    """L'extrait de la page va dans le dernier message ; le préfixe ne change pas"""
+    context = "\n[Page 1]\nSommaire\n[Page 2]\nNet return 9,8 %\n---\n\n[Page 1]\nAutre document"
+    session = ChatSession('s' * 24, document_context=context)
+    plain = session.build_messages("SYSTEM", "Quel est le net return ?")
+    paged = session.build_messages("SYSTEM", "Que dit la page 2 ?", page=2)
+
+    assert paged[0] == plain[0]
+    assert paged[-1]['content'].startswith("Voici le texte complet de la page 2 :\nNet return 9,8 %\n\n")
+    assert paged[-1]['content'].endswith("Question : Que dit la page 2 ?")
+    assert session.page_excerpt(1) == "Sommaire\n---\nAutre document"
+    assert "n'a pas été trouvée" in session.final_question("Et la page 9 ?", 9)
+
+
+def test_history_is_compacted_into_bounded_summary():
+    session = ChatSession('s' * 24)
+    for i in range(50):
+        session.add_exchange(f"Question {i} " + "x" * 300, f"Réponse {i}\n" + "y" * 500)
+
+    assert len(session.turns) == sessions.MAX_RECENT_MESSAGES
+    assert session.turns[-1]['content'].startswith("Réponse 49")
+    assert len(session.summary) <= sessions.SUMMARY_MAX_CHARS
+    # Les échanges les plus récents sortis de la fenêtre sont dans le résumé, sur une ligne
+    assert "Question 46" in session.summary
+    assert "Question 0 " not in session.summary
+    assert all(line.startswith("- Q : ") for line in session.summary.splitlines())
+
+    messages = session.build_messages("SYSTEM", "Suite ?")
+    assert messages[1]['role'] == 'system'
+    assert messages[1]['content'].startswith("Résumé des échanges précédents")
+
+
+def test_store_roundtrip_and_expiry(tmp_path):
+    store = SessionStore(str(tmp_path), ttl=60)
+    session = store.create()
+    session.set_documents("contexte", ["cours1.pdf"])
+    session.add_exchange("Q", "R")
+    store.save(session)
+
+    # Contenu des documents clients : lisible par le seul utilisateur du service
+    assert stat.S_IMODE((tmp_path / f"{session.id}.json").stat().st_mode) == 0o600
+
+    loaded = store.get(session.id)
+    assert loaded.document_context == "contexte"
+    assert loaded.documents == ["cours1.pdf"]
+    assert loaded.turns == session.turns
+
+    loaded.updated_at = time.time() - 120
+    store.save(loaded)
+    assert store.get(session.id) is None
+
+
+def test_store_rejects_invalid_ids(tmp_path):
+    store = SessionStore(str(tmp_path))
+    assert store.get('../../etc/passwd') is None
+    assert store.get('') is None
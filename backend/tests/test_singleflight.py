@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Tests de la coalescence des appels amont identiques (single-flight)
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+CURRENT_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = CURRENT_DIR.parent
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from utils.resilience import UpstreamError
+from utils.singleflight import SingleFlight, fcntl, request_key
+
+
+def _run_concurrently(flights, key, fn, count=5):
+    results = []
+    threads = [
+        threading.Thread(target=lambda f=flights[i % len(flights)]: results.append(f.do(key, fn)))
+        for i in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_request_key():
+    """Clé stable pour des requêtes identiques, distincte sinon"""
+    data = {'model': 'm', 'messages': [{'role': 'user', 'content': 'page 6 ?'}]}
+    assert request_key(data) == request_key(dict(data))
+    assert request_key(data) != request_key({'model': 'm2', 'messages': data['messages']})
+    assert request_key(b'image', 'ctx') != request_key(b'imagectx')
+
+
+def test_concurrent_calls_are_coalesced():
+    """Les appels concurrents de même clé partagent un seul appel amont"""
+    flight = SingleFlight()
+    calls = []
+
+    def upstream():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'réponse'
+
+    results = _run_concurrently([flight], 'k', upstream)
+    assert results == ['réponse'] * 5
+    assert len(calls) == 1
+    assert flight.get_stats()['coalesced_calls'] == 4
+    assert flight.get_stats()['in_flight'] == 0
+
+    # Une fois l'appel terminé, un nouvel appel repart vers l'amont (pas de cache)
+    flight.do('k', upstream)
+    assert len(calls) == 2
+
+
+def test_errors_are_shared_not_kept():
+    """Une erreur est propagée aux suiveurs en vol, puis oubliée"""
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.1)
+        raise RuntimeError('amont indisponible')
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('k', failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+    assert flight.do('k', lambda: 'ok') == 'ok'
+
+
+@pytest.mark.skipif(fcntl is None, reason="flock indisponible")
+def test_coalescing_across_workers(tmp_path):
+    """Deux instances partageant un lock_dir simulent deux workers"""
+    workers = [SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))]
+    calls = []
+
+    def upstream():
+        calls.append(1)
+        time.sleep(0.3)
+        return {'answer': 'partagée'}
+
+    results = _run_concurrently(workers, 'k', upstream, count=2)
+    assert results == [{'answer': 'partagée'}] * 2
+    assert len(calls) == 1
+
+
+@pytest.mark.skipif(fcntl is None, reason="flock indisponible")
+def test_leader_failure_is_shared_across_workers(tmp_path):
+    """Un échec du meneur est relevé par les autres workers, sans nouvel appel amont"""
+    workers = [SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))]
+    calls = []
+
+    def upstream():
+        calls.append(1)
+        time.sleep(0.3)
+        raise UpstreamError('indisponible', status=503, retry_after=7)
+
+    errors = []
+
+    def call(worker):
+        try:
+            worker.do('k', upstream)
+        except UpstreamError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len(errors) == 2
+    assert {e.status for e in errors} == {503}
+
+
+@pytest.mark.skipif(fcntl is None, reason="flock indisponible")
+def test_lock_wait_is_bounded(tmp_path):
+    """Un verrou tenu trop longtemps par un autre worker n'immobilise pas le suiveur"""
+    with open(tmp_path / 'k.lock', 'a') as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        flight = SingleFlight(str(tmp_path), max_wait=0.2)
+        start = time.monotonic()
+        assert flight.do('k', lambda: 'direct') == 'direct'
+        assert time.monotonic() - start < 1
+
+
+@pytest.mark.skipif(fcntl is None, reason="flock indisponible")
+def test_open_circuit_is_shared_as_such(tmp_path):
+    """Un circuit ouvert chez le meneur reste un CircuitOpenError chez les suiveurs (503)"""
+    from utils.resilience import CircuitOpenError
+
+    workers = [SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))]
+
+    def upstream():
+        time.sleep(0.3)
+        raise CircuitOpenError('openrouter', 12)
+
+    errors = []
+
+    def call(worker):
+        try:
+            worker.do('k', upstream)
+        except UpstreamError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 2
+    assert all(isinstance(e, CircuitOpenError) and e.retry_after == 12 for e in errors)
+
+
+@pytest.mark.skipif(fcntl is None, reason="flock indisponible")
+def test_vision_follower_caches_shared_result(tmp_path, monkeypatch):
+    """Le worker suiveur met en cache la description produite par le meneur ;
+    graphique et tableau d'une même image ne sont pas coalescés"""
+    from utils import vision
+
+    monkeypatch.setattr(vision, 'VISION_CACHE_FILE', tmp_path / 'vision_cache.json')
+    calls = []
+
+    def fake_api(self, image_bytes, context="", kind="image"):
+        calls.append(kind)
+        time.sleep(0.3)
+        return f"description {kind}"
+
+    monkeypatch.setattr(vision.VisionAnalyzer, '_optimize_image_for_api', lambda self, data: data)
+    monkeypatch.setattr(vision.VisionAnalyzer, '_call_vision_api_with_retry', fake_api)
+    analyzers = [vision.VisionAnalyzer(), vision.VisionAnalyzer()]
+    for analyzer in analyzers:
+        analyzer._inflight = SingleFlight(str(tmp_path / 'locks'))
+
+    results = []
+    threads = [threading.Thread(target=lambda a=a: results.append(a.describe_chart(b'image')))
+               for a in analyzers]
+    threads.append(threading.Thread(target=lambda: analyzers[0].describe_table(b'image')))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["description chart"] * 2
+    assert sorted(calls) == ['chart', 'table']
+    assert all(analyzer.cache for analyzer in analyzers)
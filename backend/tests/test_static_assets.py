@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Tests du service des assets statiques (manifeste, ETag, Range, pré-compression)
+"""
+
+import gzip
+import sys
+from pathlib import Path
+
+from flask import Flask
+
+CURRENT_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = CURRENT_DIR.parent
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from utils.static_assets import MANIFEST_NAME, StaticAssets, build_manifest
+
+
+def _make_static_dir(tmp_path):
+    static_dir = tmp_path / 'static'
+    (static_dir / 'src' / 'js').mkdir(parents=True)
+    (static_dir / 'src' / 'js' / 'app.js').write_text('console.log("finassist");\n' * 200)
+    (static_dir / 'doc.pdf').write_bytes(bytes(range(256)) * 40)
+    (static_dir / 'index.html').write_text(
+        '<html><script src="src/js/app.js"></script>'
+        '<script src="https://cdn.example.com/lib.js"></script></html>'
+    )
+    return static_dir
+
+
+def _make_app(static_dir):
+    app = Flask(__name__)
+    assets = StaticAssets(static_dir)
+
+    @app.route('/<path:path>')
+    def serve(path):
+        if path.endswith('.html'):
+            return assets.send_html(path)
+        return assets.send(path)
+
+    return app, assets
+
+
+def test_build_manifest(tmp_path):
+    """Le manifeste contient les hashes et les variantes gzip des fichiers texte"""
+    static_dir = _make_static_dir(tmp_path)
+    manifest = build_manifest(static_dir)
+
+    assert (static_dir / MANIFEST_NAME).exists()
+    assert 'gzip' in manifest['src/js/app.js']['encodings']
+    assert manifest['doc.pdf']['encodings'] == []
+    assert (static_dir / 'src' / 'js' / 'app.js.gz').exists()
+    assert 'src/js/app.js.gz' not in manifest
+
+
+def test_etag_and_conditional(tmp_path):
+    """ETag basé sur le contenu et réponse 304 en revalidation"""
+    static_dir = _make_static_dir(tmp_path)
+    build_manifest(static_dir)
+    app, assets = _make_app(static_dir)
+    client = app.test_client()
+
+    resp = client.get('/doc.pdf')
+    etag = assets.lookup('doc.pdf')['hash']
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] == f'"{etag}"'
+    assert 'no-cache' in resp.headers['Cache-Control']
+
+    resp = client.get('/doc.pdf', headers={'If-None-Match': f'"{etag}"'})
+    assert resp.status_code == 304
+
+
+def test_range_request(tmp_path):
+    """Les PDF supportent les requêtes partielles (chargement progressif PDF.js)"""
+    static_dir = _make_static_dir(tmp_path)
+    app, _ = _make_app(static_dir)
+    client = app.test_client()
+
+    resp = client.get('/doc.pdf', headers={'Range': 'bytes=10-19'})
+    assert resp.status_code == 206
+    assert resp.data == bytes(range(10, 20))
+    assert resp.headers['Accept-Ranges'] == 'bytes'
+
+
+def test_fingerprinted_and_compressed(tmp_path):
+    """URL empreintée : cache immutable et variante gzip négociée"""
+    static_dir = _make_static_dir(tmp_path)
+    build_manifest(static_dir)
+    app, assets = _make_app(static_dir)
+    client = app.test_client()
+
+    url = '/' + assets.asset_url('src/js/app.js')
+    resp = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in resp.headers['Cache-Control']
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    assert gzip.decompress(resp.data) == (static_dir / 'src' / 'js' / 'app.js').read_bytes()
+
+    resp = client.get(url)
+    assert 'Content-Encoding' not in resp.headers
+
+
+def test_html_references_are_versioned(tmp_path):
+    """Les références locales du HTML pointent vers les URLs empreintées"""
+    static_dir = _make_static_dir(tmp_path)
+    app, assets = _make_app(static_dir)
+    client = app.test_client()
+
+    resp = client.get('/index.html')
+    html = resp.get_data(as_text=True)
+    assert f'src="src/js/app.js?v={assets.lookup("src/js/app.js")["hash"]}"' in html
+    assert 'src="https://cdn.example.com/lib.js"' in html
+
+    resp = client.get('/index.html', headers={'If-None-Match': resp.headers['ETag']})
+    assert resp.status_code == 304
+
+
+def test_changed_asset_invalidates_manifest_and_html(tmp_path):
+    """Un app.js modifié après le build change son hash et l'URL référencée par la page"""
+    static_dir = _make_static_dir(tmp_path)
+    build_manifest(static_dir)
+    app, assets = _make_app(static_dir)
+    client = app.test_client()
+
+    old_hash = assets.lookup('src/js/app.js')['hash']
+    assert f'app.js?v={old_hash}' in client.get('/index.html').get_data(as_text=True)
+
+    (static_dir / 'src' / 'js' / 'app.js').write_text('console.log("v2");\n')
+    entry = assets.lookup('src/js/app.js')
+    assert entry['hash'] != old_hash
+    # Variante gzip du build périmée : plus négociée
+    assert entry['encodings'] == []
+    html = client.get('/index.html').get_data(as_text=True)
+    assert f'app.js?v={entry["hash"]}' in html
+
+
+def test_build_outputs_are_not_served(tmp_path):
+    """Le manifeste et les variantes .gz/.br ne sont servis que via la négociation"""
+    static_dir = _make_static_dir(tmp_path)
+    build_manifest(static_dir)
+    app, _ = _make_app(static_dir)
+    client = app.test_client()
+
+    assert client.get('/' + MANIFEST_NAME).status_code == 404
+    assert client.get('/src/js/app.js.gz').status_code == 404
+    assert client.get('/src/js/app.js').status_code == 200
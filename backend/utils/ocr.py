@@ -1,8 +1,10 @@
-from PIL import Image
-import pytesseract
 import io
 
 def ocr_image(image_bytes):
+    # Imports différés : Pillow et pytesseract ne sont chargés qu'au premier OCR
+    from PIL import Image
+    import pytesseract
+
     image = Image.open(io.BytesIO(image_bytes))
     text = pytesseract.image_to_string(image, lang='eng')
     return text.strip() or "No text detected in the image." 
\ No newline at end of file
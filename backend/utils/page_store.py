@@ -0,0 +1,474 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import zstandard
+except ImportError:  # Optionnel : compression zlib uniquement
+    zstandard = None
+
+# Configuration
+PAGE_STORE_DIR = os.getenv('PAGE_STORE_DIR', os.path.join(tempfile.gettempdir(), 'finassist-pages'))
+# 'none' (lecture zero-copy), 'zlib' ou 'zstd'
+PAGE_STORE_COMPRESSION = os.getenv('PAGE_STORE_COMPRESSION', 'none')
+# Chaque store ouvert garde un descripteur de fichier (mmap) : borne bien sous RLIMIT_NOFILE
+PAGE_STORE_MAX_OPEN = int(os.getenv('PAGE_STORE_MAX_OPEN', '128'))
+# Rétention du texte extrait des documents clients : durée depuis le dernier accès et taille totale
+PAGE_STORE_TTL_SECONDS = int(os.getenv('PAGE_STORE_TTL_SECONDS', str(31 * 24 * 3600)))
+PAGE_STORE_MAX_BYTES = int(os.getenv('PAGE_STORE_MAX_BYTES', str(1024 ** 3)))
+PRUNE_INTERVAL_SECONDS = 300
+BLOCK_PAGES = 16
+# Versions successives d'un même document conservées dans sa lignée
+LINEAGE_MAX_VERSIONS = 12
+
+# En-tête : magic, version, codec, nb pages, pages par bloc, nb blocs
+_MAGIC = b'FAPS'
+_VERSION = 2
+# Empreintes par page : rendu (flux de contenu + ressources) et texte extrait
+_HASH_SIZE = 16
+_NO_HASH = bytes(_HASH_SIZE)
+_HEADER = struct.Struct('<4sHHIII')
+_CODECS = {'none': 0, 'zlib': 1, 'zstd': 2}
+_CODEC_NAMES = {v: k for k, v in _CODECS.items()}
+_NATIVE_LITTLE = sys.byteorder == 'little'
+
+
+def _pad8(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _table(view: memoryview, typecode: str) -> memoryview:
+    """Table d'entiers sans copie (little-endian natif), sinon copie convertie"""
+    if _NATIVE_LITTLE:
+        return view.cast(typecode)
+    table = array(typecode, view.tobytes())
+    table.byteswap()
+    return memoryview(table)
+
+
+def _open_store_limit(requested: int) -> int:
+    """Nombre de stores ouverts, plafonné au quart de la limite de descripteurs du processus"""
+    if resource is None:
+        return requested
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return requested
+    return max(1, min(requested, soft // 4))
+
+
+def _write_private(path: Path, data: bytes):
+    """Écriture atomique d'un fichier lisible par le seul utilisateur du service (0600)"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _text_hash(text: bytes) -> bytes:
+    return hashlib.sha256(text).digest()[:_HASH_SIZE]
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(codec: str, data) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class PageStore:
+    """Texte des pages d'un document : un buffer UTF-8 contigu et une table d'offsets.
+
+    Compatible avec l'usage existant d'une liste `[{'page': int, 'text': str}]`
+    (itération, indexation, len). Chaque page porte une empreinte de rendu et un hash
+    de texte (16 octets). Sérialisable en un fichier relu par mmap sans copie.
+    """
+
+    def __init__(self, page_numbers, page_offsets, block_offsets, data, codec: str = 'none',
+                 block_pages: int = BLOCK_PAGES, mapping: Optional[mmap.mmap] = None,
+                 fingerprints=b'', text_hashes=b''):
+        self.page_numbers = page_numbers
+        self.page_offsets = page_offsets
+        self.block_offsets = block_offsets
+        self.data = data
+        self.fingerprints = fingerprints or _NO_HASH * len(page_numbers)
+        self.text_hashes = text_hashes or _NO_HASH * len(page_numbers)
+        self.codec = codec
+        self.block_pages = block_pages
+        self._mapping = mapping
+        self._block_cache = (None, None)
+
+    @classmethod
+    def from_pages(cls, pages: List[Dict], compression: str = 'none') -> 'PageStore':
+        """Construit le store depuis la sortie de `extract_pdf_text_and_pages`"""
+        if compression not in _CODECS:
+            raise ValueError(f"Compression inconnue: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            compression = 'zlib'
+        page_numbers = array('I', (p['page'] for p in pages))
+        encoded = [p['text'].encode('utf-8') for p in pages]
+        # Pages sans empreinte de rendu (parseur ne la fournissant pas) : jamais réutilisées
+        fingerprints = b''.join(
+            bytes.fromhex(p['fingerprint']) if p.get('fingerprint') else _NO_HASH for p in pages
+        )
+        text_hashes = b''.join(_text_hash(text) for text in encoded)
+        page_offsets = array('Q', [0])
+        for text in encoded:
+            page_offsets.append(page_offsets[-1] + len(text))
+        raw = b''.join(encoded)
+
+        block_offsets = array('Q', [0])
+        if compression == 'none':
+            data = raw
+        else:
+            blocks = []
+            for start in range(0, len(pages), BLOCK_PAGES):
+                end = min(start + BLOCK_PAGES, len(pages))
+                block = _compress(compression, raw[page_offsets[start]:page_offsets[end]])
+                blocks.append(block)
+                block_offsets.append(block_offsets[-1] + len(block))
+            data = b''.join(blocks)
+        return cls(page_numbers, page_offsets, block_offsets, data, compression,
+                   fingerprints=fingerprints, text_hashes=text_hashes)
+
+    # --- Accès aux pages ---
+
+    def __len__(self) -> int:
+        return len(self.page_numbers)
+
+    def text(self, index: int) -> str:
+        """Texte de la i-ème page (index 0-based)"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = self.page_offsets[index], self.page_offsets[index + 1]
+        if self.codec == 'none':
+            return str(self.data[start:end], 'utf-8')
+        block = index // self.block_pages
+        block_start = self.page_offsets[block * self.block_pages]
+        raw = self._block(block)
+        return str(raw[start - block_start:end - block_start], 'utf-8')
+
+    def _block(self, block: int) -> bytes:
+        # Dernier bloc décompressé gardé en mémoire : lecture séquentielle des pages
+        cached_block, cached_raw = self._block_cache
+        if cached_block == block:
+            return cached_raw
+        raw = _decompress(self.codec, self.data[self.block_offsets[block]:self.block_offsets[block + 1]])
+        self._block_cache = (block, raw)
+        return raw
+
+    def __getitem__(self, index: int) -> Dict:
+        if index < 0:
+            index += len(self)
+        return {'page': self.page_numbers[index], 'text': self.text(index)}
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def page_text(self, page_number: int) -> Optional[str]:
+        """Texte d'une page par son numéro (1-based), None si absente"""
+        index = bisect_left(self.page_numbers, page_number)
+        if index < len(self) and self.page_numbers[index] == page_number:
+            return self.text(index)
+        return None
+
+    def fingerprint(self, index: int) -> Optional[str]:
+        """Empreinte de rendu de la i-ème page (hex), None si inconnue"""
+        value = bytes(self.fingerprints[index * _HASH_SIZE:(index + 1) * _HASH_SIZE])
+        return None if value == _NO_HASH else value.hex()
+
+    def text_hash(self, index: int) -> str:
+        return bytes(self.text_hashes[index * _HASH_SIZE:(index + 1) * _HASH_SIZE]).hex()
+
+    def fingerprint_index(self) -> Dict[str, int]:
+        """Empreinte de rendu -> index de page, pour réutiliser les pages inchangées"""
+        index = {}
+        for i in range(len(self)):
+            fingerprint = self.fingerprint(i)
+            if fingerprint is not None:
+                index.setdefault(fingerprint, i)
+        return index
+
+    def changed_pages(self, previous: Optional['PageStore']) -> List[int]:
+        """Numéros des pages dont le texte diffère de la version précédente"""
+        known = set()
+        if previous is not None:
+            known = {previous.text_hash(i) for i in range(len(previous))}
+        return [self.page_numbers[i] for i in range(len(self)) if self.text_hash(i) not in known]
+
+    @property
+    def nbytes(self) -> int:
+        """Taille du buffer de texte et des tables"""
+        return (len(self.data) + len(self.page_numbers) * 4
+                + len(self.page_offsets) * 8 + len(self.block_offsets) * 8
+                + len(self.fingerprints) + len(self.text_hashes))
+
+    # --- Sérialisation ---
+
+    def to_bytes(self) -> bytes:
+        page_numbers = array('I', self.page_numbers)
+        page_offsets = array('Q', self.page_offsets)
+        block_offsets = array('Q', self.block_offsets)
+        if not _NATIVE_LITTLE:
+            for table in (page_numbers, page_offsets, block_offsets):
+                table.byteswap()
+        header = _HEADER.pack(_MAGIC, _VERSION, _CODECS[self.codec], len(self),
+                              self.block_pages, len(block_offsets) - 1)
+        parts = [header, b'\0' * (_pad8(_HEADER.size) - _HEADER.size)]
+        numbers = page_numbers.tobytes()
+        parts += [numbers, b'\0' * (_pad8(len(numbers)) - len(numbers))]
+        parts += [page_offsets.tobytes(), block_offsets.tobytes()]
+        parts += [bytes(self.fingerprints), bytes(self.text_hashes), bytes(self.data)]
+        return b''.join(parts)
+
+    def save(self, path: Path):
+        """Écriture atomique dans un seul fichier (0600)"""
+        _write_private(Path(path), self.to_bytes())
+
+    @classmethod
+    def from_buffer(cls, buffer, mapping: Optional[mmap.mmap] = None) -> 'PageStore':
+        """Relit un store sérialisé ; les tables et le texte restent des vues sur `buffer`"""
+        view = memoryview(buffer)
+        magic, version, codec, page_count, block_pages, block_count = _HEADER.unpack_from(view, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Fichier de pages invalide")
+        pos = _pad8(_HEADER.size)
+        page_numbers = _table(view[pos:pos + page_count * 4], 'I')
+        pos += _pad8(page_count * 4)
+        page_offsets = _table(view[pos:pos + (page_count + 1) * 8], 'Q')
+        pos += (page_count + 1) * 8
+        block_offsets = _table(view[pos:pos + (block_count + 1) * 8], 'Q')
+        pos += (block_count + 1) * 8
+        hashes_size = page_count * _HASH_SIZE
+        fingerprints = view[pos:pos + hashes_size]
+        text_hashes = view[pos + hashes_size:pos + 2 * hashes_size]
+        pos += 2 * hashes_size
+        return cls(page_numbers, page_offsets, block_offsets, view[pos:],
+                   _CODEC_NAMES[codec], block_pages, mapping,
+                   fingerprints=fingerprints, text_hashes=text_hashes)
+
+    @classmethod
+    def load(cls, path: Path) -> 'PageStore':
+        """Mappe le fichier en mémoire (lecture seule, partagé via le page cache)"""
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.from_buffer(mapping, mapping)
+
+    def close(self):
+        if self._mapping is not None:
+            # Les vues doivent être libérées avant de fermer le mmap
+            for name in ('page_numbers', 'page_offsets', 'block_offsets', 'data',
+                         'fingerprints', 'text_hashes'):
+                value = getattr(self, name)
+                if isinstance(value, memoryview):
+                    value.release()
+            self._mapping.close()
+            self._mapping = None
+
+
+class PageStoreCache:
+    """Documents parsés, indexés par hash de contenu : fichiers `.pages` mappés à la demande.
+
+    Les stores ouverts sont bornés (LRU) ; les autres restent chauds dans le page cache de l'OS.
+    Une lignée par nom de document relie chaque nouvelle version à la précédente : les pages
+    dont l'empreinte de rendu est inchangée reprennent leur texte sans ré-extraction.
+    Les fichiers non lus depuis `ttl` secondes, puis les plus anciens au-delà de `max_bytes`,
+    sont supprimés.
+    """
+
+    def __init__(self, store_dir: str = PAGE_STORE_DIR, max_open: int = PAGE_STORE_MAX_OPEN,
+                 compression: str = PAGE_STORE_COMPRESSION, ttl: int = PAGE_STORE_TTL_SECONDS,
+                 max_bytes: int = PAGE_STORE_MAX_BYTES):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.lineage_dir = self.store_dir / 'lineage'
+        self.lineage_dir.mkdir(mode=0o700, exist_ok=True)
+        self.max_open = _open_store_limit(max_open)
+        self.compression = compression
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._last_prune = 0.0
+        self._open: 'OrderedDict[str, PageStore]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.pages_reused = 0
+        self.pages_parsed = 0
+
+    def get_or_parse(self, pdf_bytes: bytes, parse: Callable[..., List[Dict]],
+                     name: Optional[str] = None) -> PageStore:
+        """Retourne les pages du document, en ne parsant le PDF qu'à la première rencontre.
+
+        `parse(pdf_bytes, reuse)` reçoit `reuse(fingerprint) -> Optional[str]` qui fournit le
+        texte des pages inchangées depuis la version précédente du document `name`.
+        """
+        key = hashlib.sha256(pdf_bytes).hexdigest()
+        store = self._get(key)
+        if store is not None:
+            self.hits += 1
+            self._touch(self.store_dir / f"{key}.pages")
+            return store
+
+        previous = self._get(self._latest_version(name)) if name else None
+        reuse = None
+        reused = []
+        if previous is not None:
+            known = previous.fingerprint_index()
+
+            def reuse(fingerprint: str) -> Optional[str]:
+                index = known.get(fingerprint)
+                if index is None:
+                    return None
+                reused.append(fingerprint)
+                return previous.text(index)
+
+        self.misses += 1
+        pages = parse(pdf_bytes, reuse)
+        self.pages_reused += len(reused)
+        self.pages_parsed += len(pages) - len(reused)
+        PageStore.from_pages(pages, self.compression).save(self.store_dir / f"{key}.pages")
+        store = self._get(key)
+        if name:
+            changed = store.changed_pages(previous)
+            self._record_version(name, key, previous is not None, len(store), changed)
+            if previous is not None:
+                print(f"♻️ Nouvelle version de {name} : {len(pages) - len(reused)}/{len(pages)} "
+                      f"pages extraites, {len(changed)} modifiées")
+        self._prune()
+        return store
+
+    def _get(self, key: Optional[str]) -> Optional[PageStore]:
+        """Store ouvert, ou mappé depuis son fichier ; None s'il n'existe pas"""
+        if not key:
+            return None
+        with self._lock:
+            store = self._open.get(key)
+            if store is not None:
+                self._open.move_to_end(key)
+                return store
+
+        path = self.store_dir / f"{key}.pages"
+        if not path.exists():
+            return None
+        try:
+            store = PageStore.load(path)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Erreur lecture store de pages: {e}")
+            return None
+
+        with self._lock:
+            self._open[key] = store
+            # Pas de close() à l'éviction : une requête peut encore lire le store, le GC libère le mmap
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return store
+
+    # --- Lignée des versions ---
+
+    def _lineage_path(self, name: str) -> Path:
+        name_hash = hashlib.sha256(name.lower().encode('utf-8')).hexdigest()[:32]
+        return self.lineage_dir / f"{name_hash}.json"
+
+    def lineage(self, name: str) -> List[Dict]:
+        """Versions connues d'un document, de la plus ancienne à la plus récente"""
+        try:
+            with open(self._lineage_path(name), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _latest_version(self, name: str) -> Optional[str]:
+        versions = self.lineage(name)
+        return versions[-1]['key'] if versions else None
+
+    def _record_version(self, name: str, key: str, has_previous: bool, page_count: int,
+                        changed_pages: List[int]):
+        versions = self.lineage(name)
+        versions.append({
+            'key': key,
+            'previous': versions[-1]['key'] if versions and has_previous else None,
+            'pages': page_count,
+            'changed_pages': changed_pages,
+            'created_at': time.time()
+        })
+        try:
+            _write_private(self._lineage_path(name), json.dumps(versions[-LINEAGE_MAX_VERSIONS:]).encode('utf-8'))
+        except OSError as e:
+            print(f"Erreur sauvegarde lignée: {e}")
+
+    # --- Rétention ---
+
+    @staticmethod
+    def _touch(path: Path):
+        # mtime = dernier accès : base de l'expiration et de l'éviction par taille
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _prune(self, force: bool = False):
+        """Supprime les stores et lignées expirés, puis les plus anciens au-delà de `max_bytes`"""
+        now = time.time()
+        if not force and now - self._last_prune < PRUNE_INTERVAL_SECONDS:
+            return
+        self._last_prune = now
+        cutoff = now - self.ttl
+        stores = []
+        try:
+            for path in list(self.store_dir.glob('*.pages')) + list(self.lineage_dir.glob('*.json')):
+                stat = path.stat()
+                if stat.st_mtime < cutoff:
+                    self._remove(path)
+                elif path.suffix == '.pages':
+                    stores.append((stat.st_mtime, stat.st_size, path))
+        except OSError:
+            pass
+        total = sum(size for _, size, _ in stores)
+        for _, size, path in sorted(stores):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path: Path):
+        # Un store encore mappé par un worker reste lisible jusqu'à sa fermeture (unlink POSIX)
+        with self._lock:
+            self._open.pop(path.stem, None)
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def get_stats(self) -> Dict:
+        return {
+            'open_stores': len(self._open),
+            'hits': self.hits,
+            'misses': self.misses,
+            'pages_reused': self.pages_reused,
+            'pages_parsed': self.pages_parsed
+        }
@@ -1,14 +1,94 @@
+import hashlib
 import io
+from typing import Optional
 from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
 
-def extract_pdf_text_and_pages(pdf_bytes):
-    """Extrait le texte des pages PDF"""
+# Taille des empreintes de page (octets de SHA-256)
+FINGERPRINT_SIZE = 16
+
+
+class _Unhashable(Exception):
+    """Flux que PyPDF2 ne sait pas décoder : la page n'a pas d'empreinte fiable"""
+
+
+def _hash_object(obj, digest, memo):
+    """Hash structurel d'un objet PDF ; les objets indirects partagés (polices, images) sont hashés une fois"""
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key not in memo:
+            memo[key] = b''  # Garde contre les références cycliques
+            sub_digest = hashlib.sha256()
+            try:
+                _hash_object(obj.get_object(), sub_digest, memo)
+            except Exception:
+                memo[key] = None
+                raise
+            memo[key] = sub_digest.digest()
+        if memo[key] is None:
+            raise _Unhashable(key)
+        digest.update(b'R' + memo[key])
+    elif isinstance(obj, StreamObject):
+        digest.update(b'S')
+        _hash_object(DictionaryObject(obj), digest, memo)
+        digest.update(obj.get_data() or b'')
+    elif isinstance(obj, DictionaryObject):
+        digest.update(b'D')
+        # Valeurs brutes : obj[key] résoudrait les références avant le mémo des objets partagés
+        for key, value in sorted(obj.items()):
+            if key == '/Parent':
+                continue
+            digest.update(str(key).encode('utf-8', 'surrogatepass'))
+            _hash_object(value, digest, memo)
+    elif isinstance(obj, ArrayObject):
+        digest.update(b'A%d' % len(obj))
+        for item in obj:
+            _hash_object(item, digest, memo)
+    else:
+        digest.update(repr(obj).encode('utf-8', 'surrogatepass'))
+
+
+def page_fingerprint(page, memo=None) -> Optional[str]:
+    """Empreinte du rendu d'une page : flux de contenu et ressources (polices, images).
+
+    Deux pages de même empreinte s'affichent et s'extraient à l'identique, sans rasteriser.
+    None si un flux ne peut pas être décodé : la page est alors toujours ré-extraite.
+    """
+    resources = page.get('/Resources')
+    node = page
+    # Ressources héritées de l'arbre des pages
+    while resources is None and '/Parent' in node:
+        node = node['/Parent'].get_object()
+        resources = node.get('/Resources')
+    digest = hashlib.sha256()
+    memo = {} if memo is None else memo
+    try:
+        _hash_object(page.get('/Contents'), digest, memo)
+        _hash_object(resources, digest, memo)
+        _hash_object(page.get('/Rotate', 0), digest, memo)
+    except Exception as e:
+        print(f"⚠️ Empreinte de page indisponible: {e}")
+        return None
+    return digest.digest()[:FINGERPRINT_SIZE].hex()
+
+
+def extract_pdf_text_and_pages(pdf_bytes, reuse=None):
+    """Extrait le texte des pages PDF
+
+    `reuse(fingerprint)` peut fournir le texte d'une page identique déjà extraite
+    (version précédente du document) : seules les pages modifiées sont ré-extraites.
+    """
     reader = PdfReader(io.BytesIO(pdf_bytes))
     pages = []
+    memo = {}
     for i, page in enumerate(reader.pages):
-        text = page.extract_text() or ""
+        fingerprint = page_fingerprint(page, memo)
+        text = reuse(fingerprint) if reuse is not None and fingerprint else None
+        if text is None:
+            text = (page.extract_text() or "").strip()
         pages.append({
             'page': i+1,
-            'text': text.strip()
+            'text': text,
+            'fingerprint': fingerprint
         })
-    return pages 
\ No newline at end of file
+    return pages
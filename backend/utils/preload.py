@@ -0,0 +1,71 @@
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class StartupReport:
+    """Durée des phases de démarrage (imports, préchargements) et mémoire du processus"""
+
+    def __init__(self):
+        self.phases: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def format(self) -> str:
+        lines = [f"🚀 Démarrage FinAssist (pid {os.getpid()})"]
+        for name, duration in self.phases:
+            lines.append(f"   - {name}: {duration * 1000:.0f} ms")
+        lines.append(f"   = total: {sum(d for _, d in self.phases) * 1000:.0f} ms")
+        if resource is not None:
+            # ru_maxrss est en Ko sous Linux
+            lines.append(f"   RSS max: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} Mo")
+        return "\n".join(lines)
+
+
+class StaticDocumentCache:
+    """Texte extrait des documents statiques, invalidé sur (mtime, taille).
+
+    En mode `--preload`, rempli dans le master Gunicorn puis partagé en copy-on-write.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._lock = threading.Lock()
+
+    def get_text(self, path: str, extract: Callable[[], str]) -> str:
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+        text = extract()
+        with self._lock:
+            self._entries[path] = (signature, text)
+        return text
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def freeze_shared_heap():
+    """Avant le fork : déplace les objets préchargés hors du GC pour limiter les copies de pages"""
+    gc.collect()
+    gc.freeze()
+
+
+startup_report = StartupReport()
+static_documents = StaticDocumentCache()
@@ -0,0 +1,248 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import requests
+
+# Configuration
+OPENROUTER_CHAT_URL = "https://openrouter.ai/api/v1/chat/completions"
+UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', '3'))
+# Budget total (essais + attentes) : nettement sous le timeout des workers Gunicorn (120s),
+# la marge couvre l'extraction des documents et l'écriture de la réponse
+UPSTREAM_DEADLINE_SECONDS = float(os.getenv('UPSTREAM_DEADLINE_SECONDS', '75'))
+# En dessous, un essai n'a aucune chance d'aboutir : échec immédiat
+MIN_ATTEMPT_SECONDS = 1.0
+# 0 = requêtes couvertes (hedging) désactivées
+UPSTREAM_HEDGE_AFTER_SECONDS = float(os.getenv('UPSTREAM_HEDGE_AFTER_SECONDS', '0'))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '30'))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 20.0
+
+# Statuts pour lesquels un nouvel essai a une chance d'aboutir
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='hedge')
+
+
+class UpstreamError(Exception):
+    """Échec d'un appel amont (statut HTTP, timeout ou erreur réseau)"""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        # Pas de statut : timeout ou erreur réseau
+        return self.status is None or self.status in RETRYABLE_STATUSES
+
+    @property
+    def is_upstream_fault(self) -> bool:
+        """Les erreurs client (4xx hors 408/425/429) ne comptent pas contre le circuit"""
+        return self.retryable
+
+
+class CircuitOpenError(UpstreamError):
+    """Circuit ouvert : l'amont est considéré dégradé, échec immédiat"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit {name} ouvert", status=503, retry_after=retry_after)
+        self.name = name
+
+    @property
+    def retryable(self) -> bool:
+        return False
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Convertit l'en-tête Retry-After (secondes ou date HTTP) en secondes"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Backoff exponentiel avec jitter complet ; Retry-After sert de plancher"""
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class CircuitBreaker:
+    """Disjoncteur : s'ouvre après N échecs amont consécutifs, une sonde passe après le délai"""
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def before_call(self):
+        """Lève CircuitOpenError si l'appel doit échouer immédiatement"""
+        with self._lock:
+            if self.state == 'closed':
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == 'open' and remaining <= 0:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpenError(self.name, max(remaining, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                print(f"✅ Circuit {self.name} refermé")
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"⚡ Circuit {self.name} ouvert après {self.failures} échecs")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.failures}
+
+
+class ResilientClient:
+    """Appels HTTP amont : retries par classe de statut, backoff avec jitter,
+    disjoncteur partagé et requêtes couvertes optionnelles."""
+
+    def __init__(self, name: str, max_retries: int = UPSTREAM_MAX_RETRIES,
+                 deadline: float = UPSTREAM_DEADLINE_SECONDS,
+                 hedge_after: float = UPSTREAM_HEDGE_AFTER_SECONDS,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker(name)
+        self.retries_count = 0
+        self.hedges_count = 0
+
+    def post_json(self, url: str, headers: Dict, payload: Dict, timeout: float = 60,
+                  max_retries: Optional[int] = None, deadline: Optional[float] = None) -> Dict:
+        """POST JSON avec résilience ; retourne le corps JSON d'une réponse 200 ou lève UpstreamError"""
+        return self.call(
+            lambda attempt_timeout: self._post_once(url, headers, payload, attempt_timeout),
+            timeout, max_retries, deadline
+        )
+
+    def call(self, send: Callable[[float], Dict], timeout: float = 60, max_retries: Optional[int] = None,
+             deadline: Optional[float] = None) -> Dict:
+        """Exécute `send(timeout)` (un essai) avec retries, disjoncteur et hedging.
+
+        Chaque essai reçoit `min(timeout, temps restant)` : la durée totale reste bornée par le
+        budget du client et, si fourni, par `deadline` (instant `time.monotonic()` de la requête).
+        """
+        attempts = max(1, self.max_retries if max_retries is None else max_retries)
+        budget_end = time.monotonic() + self.deadline
+        if deadline is not None:
+            budget_end = min(budget_end, deadline)
+        for attempt in range(attempts):
+            remaining = budget_end - time.monotonic()
+            if remaining < MIN_ATTEMPT_SECONDS:
+                print(f"⏱️ {self.name}: budget épuisé avant l'essai {attempt + 1}, abandon")
+                raise UpstreamError(f"{self.name}: délai dépassé")
+            self.breaker.before_call()
+            try:
+                result = self._attempt(send, min(timeout, remaining), budget_end)
+            except UpstreamError as e:
+                if e.is_upstream_fault:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if not e.retryable or attempt == attempts - 1:
+                    raise
+                delay = backoff_delay(attempt, e.retry_after)
+                if time.monotonic() + delay + MIN_ATTEMPT_SECONDS > budget_end:
+                    print(f"⏱️ {self.name}: budget de retry épuisé, abandon")
+                    raise
+                self.retries_count += 1
+                print(f"🔄 {self.name}: nouvel essai dans {delay:.1f}s ({e.status or 'réseau'}, tentative {attempt + 2}/{attempts})")
+                time.sleep(delay)
+            except Exception:
+                # Réponse inexploitable (JSON invalide...) : compte comme un échec amont
+                self.breaker.record_failure()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+        raise UpstreamError(f"{self.name}: aucun essai effectué")
+
+    def _attempt(self, send: Callable[[float], Dict], timeout: float, budget_end: float) -> Dict:
+        """Un essai ; si activé, une requête couverte part après `hedge_after` secondes"""
+        if not self.hedge_after or self.hedge_after >= timeout:
+            return send(timeout)
+        futures = [_hedge_executor.submit(send, timeout)]
+        done, _ = wait(futures, timeout=self.hedge_after)
+        hedge_timeout = min(timeout - self.hedge_after, budget_end - time.monotonic())
+        if not done and hedge_timeout >= MIN_ATTEMPT_SECONDS:
+            self.hedges_count += 1
+            print(f"🪃 {self.name}: requête couverte après {self.hedge_after:.1f}s")
+            futures.append(_hedge_executor.submit(send, hedge_timeout))
+        pending = set(futures)
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except UpstreamError as e:
+                    last_error = e
+        raise last_error
+
+    def _post_once(self, url: str, headers: Dict, payload: Dict, timeout: float) -> Dict:
+        try:
+            resp = requests.post(url, headers=headers, json=payload, timeout=timeout)
+        except requests.exceptions.Timeout as e:
+            raise UpstreamError(f"Timeout: {e}") from e
+        except requests.exceptions.RequestException as e:
+            raise UpstreamError(f"Erreur réseau: {e}") from e
+        if resp.status_code != 200:
+            raise UpstreamError(
+                resp.text,
+                status=resp.status_code,
+                retry_after=parse_retry_after(resp.headers.get('Retry-After'))
+            )
+        return resp.json()
+
+    def get_stats(self) -> Dict:
+        return {
+            'circuit': self.breaker.get_stats(),
+            'retries': self.retries_count,
+            'hedged_requests': self.hedges_count
+        }
+
+
+# Client partagé : un seul disjoncteur pour OpenRouter (chat et vision)
+openrouter_client = ResilientClient('openrouter')
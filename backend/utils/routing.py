@@ -0,0 +1,171 @@
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Table des tiers de modèles : timeout amont par essai, plafond de tokens de réponse,
+# fenêtre de prompt, et prix indicatif (estimation journalisée, non plafonnée)
+MODEL_TIERS: Dict[str, Dict] = {
+    'fast': {
+        'model': os.getenv('ROUTING_FAST_MODEL', 'openai/gpt-4o-mini'),
+        'timeout': 20,
+        'max_tokens': 600,
+        'max_prompt_tokens': 100000,
+        'cost_per_1k_tokens': 0.00015
+    },
+    'standard': {
+        'model': os.getenv('ROUTING_STANDARD_MODEL', 'openai/gpt-4-turbo'),
+        'timeout': 60,
+        'max_tokens': 1500,
+        'max_prompt_tokens': 120000,
+        'cost_per_1k_tokens': 0.01
+    },
+    'strong': {
+        'model': os.getenv('ROUTING_STRONG_MODEL', 'anthropic/claude-3-5-sonnet'),
+        # Doit tenir après le tier rapide dans UPSTREAM_DEADLINE_SECONDS pour que l'escalade serve
+        'timeout': 45,
+        'max_tokens': 2000,
+        'max_prompt_tokens': 180000,
+        'cost_per_1k_tokens': 0.003
+    },
+    'vision_fast': {
+        'model': os.getenv('ROUTING_VISION_FAST_MODEL', 'openai/gpt-4o-mini'),
+        'timeout': 20,
+        'max_tokens': 600,
+        'max_prompt_tokens': 12000,
+        'cost_per_1k_tokens': 0.00015
+    },
+    'vision': {
+        # Pas de timeout propre : REQUEST_TIMEOUT de utils/vision.py
+        'model': os.getenv('ROUTING_VISION_MODEL', 'anthropic/claude-3-5-sonnet'),
+        'max_tokens': 1000,
+        'max_prompt_tokens': 180000,
+        'cost_per_1k_tokens': 0.003
+    }
+}
+TIER_ORDER = ['fast', 'standard', 'strong']
+ROUTING_CASCADE = os.getenv('ROUTING_CASCADE', '1') == '1'
+LARGE_PROMPT_TOKENS = 4000
+MIN_CONFIDENT_ANSWER_CHARS = 40
+
+PAGE_RE = re.compile(r'page[s]?\s*(\d+)', re.IGNORECASE)
+# Questions analytiques : synthèse, comparaison, mécanismes (FR + EN)
+ANALYTIC_RE = re.compile(
+    r"\b(analy[sz]\w*|compar\w*|synth[èe]\w*|structure\w*|strat[ée]g\w*|risque\w*|risk\w*|"
+    r"frais|fees?|pourquoi|why|impact\w*|[ée]valu\w*|explique\w*|explain\w*|"
+    r"recommand\w*|recommend\w*|tendance\w*|trend\w*|diff[ée]ren\w*)\b",
+    re.IGNORECASE
+)
+LOW_CONFIDENCE_MARKERS = (
+    'non mentionné', 'je ne sais pas', 'je ne peux pas', "pas d'information",
+    'impossible de déterminer', 'not mentioned', "i don't know", 'i cannot', 'unable to'
+)
+
+
+@dataclass
+class RouteDecision:
+    """Tier choisi pour une requête, avec les signaux qui ont motivé le choix"""
+    tier: str
+    cascade: List[str]
+    page: Optional[int] = None
+    reasons: List[str] = field(default_factory=list)
+
+    @property
+    def model(self) -> str:
+        return MODEL_TIERS[self.tier]['model']
+
+
+def requested_page(question: str) -> Optional[int]:
+    """Numéro de page visé par la question, s'il y en a un"""
+    page_match = PAGE_RE.search(question)
+    return int(page_match.group(1)) if page_match else None
+
+
+def classify_request(question: str, prompt_tokens: int, doc_count: int = 1,
+                     context_tokens: Optional[int] = None) -> RouteDecision:
+    """Classe une question localement (page précise vs analytique, taille du prompt, nb de documents).
+
+    `prompt_tokens` mesure ce que le modèle doit lire pour répondre (question, extrait de page) ;
+    `context_tokens`, la taille totale envoyée, ne sert qu'à vérifier la fenêtre des modèles.
+    """
+    reasons = []
+    page = requested_page(question)
+    context_tokens = prompt_tokens if context_tokens is None else context_tokens
+    analytic = bool(ANALYTIC_RE.search(question))
+
+    if analytic:
+        tier = 'strong'
+        reasons.append('question analytique')
+    elif doc_count > 1:
+        tier = 'standard'
+        reasons.append(f'{doc_count} documents')
+    elif page is not None:
+        tier = 'fast'
+        reasons.append(f'page {page}')
+    else:
+        tier = 'standard'
+        reasons.append('question générale')
+
+    if prompt_tokens > LARGE_PROMPT_TOKENS and tier == 'fast':
+        tier = 'standard'
+        reasons.append(f'prompt volumineux ({prompt_tokens} tokens)')
+    # Monter d'un tier tant que le prompt dépasse la fenêtre du modèle
+    while context_tokens > MODEL_TIERS[tier]['max_prompt_tokens'] and tier != TIER_ORDER[-1]:
+        tier = TIER_ORDER[TIER_ORDER.index(tier) + 1]
+        reasons.append('contexte > fenêtre du tier précédent')
+
+    cascade = [tier]
+    if ROUTING_CASCADE and tier == 'fast':
+        cascade.append('strong')
+    return RouteDecision(tier=tier, cascade=cascade, page=page, reasons=reasons)
+
+
+def route_vision(kind: str = 'image') -> str:
+    """Tier vision : les graphiques et tableaux vont au modèle fort"""
+    return 'vision' if kind in ('chart', 'table') else 'vision_fast'
+
+
+def estimate_cost(tier: str, prompt_tokens: int) -> float:
+    """Coût estimé (USD) du prompt pour un tier"""
+    return prompt_tokens / 1000 * MODEL_TIERS[tier]['cost_per_1k_tokens']
+
+
+def _cites_page(text: str, page: int) -> bool:
+    # Numéro entier : « page 1 » ne doit pas être trouvé dans « 10 % » ou « 2019 »
+    return re.search(rf'\bpages?\s*{page}\b', text) is not None
+
+
+def is_confident(answer: str, decision: RouteDecision) -> bool:
+    """Contrôle local de confiance d'une réponse du modèle rapide"""
+    text = (answer or '').strip().lower()
+    if len(text) < MIN_CONFIDENT_ANSWER_CHARS:
+        return False
+    if any(marker in text for marker in LOW_CONFIDENCE_MARKERS):
+        return False
+    # Une question sur une page doit citer cette page
+    if decision.page is not None and not _cites_page(text, decision.page):
+        return False
+    return True
+
+
+def run_cascade(decision: RouteDecision, call_tier: Callable[[str, Optional[float]], str],
+                deadline: Optional[float] = None) -> Tuple[str, str]:
+    """Appelle les tiers de la cascade jusqu'à une réponse jugée fiable ; retourne (réponse, tier).
+
+    `deadline` (instant `time.monotonic()`) est le budget de latence de toute la requête :
+    il est transmis à chaque `call_tier(tier, deadline)`, et l'escalade est abandonnée au profit
+    de la réponse déjà obtenue quand le temps restant n'atteint pas le timeout du tier suivant.
+    """
+    for i, tier in enumerate(decision.cascade):
+        answer = call_tier(tier, deadline)
+        if i == len(decision.cascade) - 1 or is_confident(answer, decision):
+            return answer, tier
+        next_tier = decision.cascade[i + 1]
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining < MODEL_TIERS[next_tier].get('timeout', 0):
+                print(f"⏱️ Escalade {tier} -> {next_tier} abandonnée ({remaining:.0f}s restantes)")
+                return answer, tier
+        print(f"⤴️ Escalade {tier} -> {next_tier} (confiance insuffisante)")
+    raise ValueError('Cascade vide')
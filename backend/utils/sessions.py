@@ -0,0 +1,189 @@
+import json
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Configuration
+SESSION_DIR = os.getenv('SESSION_DIR', os.path.join(tempfile.gettempdir(), 'finassist-sessions'))
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', '7200'))
+# Nombre de messages (question + réponse) conservés tels quels avant compaction
+MAX_RECENT_MESSAGES = 6
+SUMMARY_MAX_CHARS = 2000
+SUMMARY_QUESTION_CHARS = 200
+SUMMARY_ANSWER_CHARS = 300
+
+_SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+# Marqueurs de page produits par extract_document_text
+_PAGE_MARKER_RE = re.compile(r'^\[Page (\d+)\]$', re.MULTILINE)
+
+
+def _one_line(text: str, limit: int) -> str:
+    text = ' '.join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+class ChatSession:
+    """Conversation côté serveur : contexte documentaire stable, résumé borné et échanges récents"""
+
+    def __init__(self, session_id: str, document_context: str = "", documents: Optional[List[str]] = None,
+                 summary: str = "", turns: Optional[List[Dict]] = None,
+                 created_at: Optional[float] = None, updated_at: Optional[float] = None):
+        self.id = session_id
+        self.document_context = document_context
+        self.documents = documents or []
+        self.summary = summary
+        self.turns = turns or []
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+
+    def set_documents(self, document_context: str, documents: List[str]):
+        """Remplace le contexte documentaire (le préfixe du prompt change une seule fois)"""
+        self.document_context = document_context
+        self.documents = documents
+
+    def page_excerpt(self, page: int) -> Optional[str]:
+        """Texte de la page `page` dans le contexte documentaire (une occurrence par document)"""
+        markers = list(_PAGE_MARKER_RE.finditer(self.document_context))
+        excerpts = []
+        for i, marker in enumerate(markers):
+            if int(marker.group(1)) != page:
+                continue
+            end = markers[i + 1].start() if i + 1 < len(markers) else len(self.document_context)
+            # Le dernier bloc d'un document s'arrête au séparateur du document suivant
+            excerpts.append(self.document_context[marker.end():end].split('\n---\n', 1)[0].strip())
+        return '\n---\n'.join(excerpts) if excerpts else None
+
+    def final_question(self, question: str, page: Optional[int] = None) -> str:
+        """Dernier message : pour une question sur une page, l'extrait de la page précède la question"""
+        if page is None:
+            return question
+        excerpt = self.page_excerpt(page)
+        if excerpt is None:
+            return f"La page {page} n'a pas été trouvée dans le document.\n\nQuestion : {question}"
+        return f"Voici le texte complet de la page {page} :\n{excerpt}\n\nQuestion : {question}"
+
+    def build_messages(self, system_prompt: str, question: str, page: Optional[int] = None) -> List[Dict]:
+        """Assemble le prompt : préfixe stable (système + documents) puis contenu variable en fin"""
+        messages = [{
+            "role": "system",
+            "content": f"{system_prompt}\nVoici le contenu des documents :\n{self.document_context}"
+        }]
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Résumé des échanges précédents :\n{self.summary}"
+            })
+        messages.extend(self.turns)
+        messages.append({"role": "user", "content": self.final_question(question, page)})
+        return messages
+
+    def add_exchange(self, question: str, answer: str):
+        """Ajoute un échange puis compacte les plus anciens dans le résumé"""
+        self.turns.append({"role": "user", "content": question})
+        self.turns.append({"role": "assistant", "content": answer})
+        self._compact()
+        self.updated_at = time.time()
+
+    def _compact(self):
+        # Compaction incrémentale : seuls les échanges sortant de la fenêtre sont résumés
+        while len(self.turns) > MAX_RECENT_MESSAGES:
+            question = self.turns.pop(0)['content']
+            answer = self.turns.pop(0)['content']
+            line = (
+                f"- Q : {_one_line(question, SUMMARY_QUESTION_CHARS)} "
+                f"→ R : {_one_line(answer, SUMMARY_ANSWER_CHARS)}"
+            )
+            lines = self.summary.splitlines() + [line] if self.summary else [line]
+            # Résumé borné : les lignes les plus anciennes sont abandonnées
+            while len(lines) > 1 and len('\n'.join(lines)) > SUMMARY_MAX_CHARS:
+                lines.pop(0)
+            self.summary = '\n'.join(lines)
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'document_context': self.document_context,
+            'documents': self.documents,
+            'summary': self.summary,
+            'turns': self.turns,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ChatSession':
+        return cls(
+            data['id'],
+            document_context=data.get('document_context', ''),
+            documents=data.get('documents'),
+            summary=data.get('summary', ''),
+            turns=data.get('turns'),
+            created_at=data.get('created_at'),
+            updated_at=data.get('updated_at')
+        )
+
+
+class SessionStore:
+    """Stockage des sessions en fichiers JSON, partagé entre les workers Gunicorn"""
+
+    def __init__(self, session_dir: str = SESSION_DIR, ttl: int = SESSION_TTL_SECONDS):
+        self.session_dir = Path(session_dir)
+        # Texte des documents clients : répertoire et fichiers réservés à l'utilisateur du service
+        self.session_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _path(self, session_id: str) -> Optional[Path]:
+        if not session_id or not _SESSION_ID_RE.match(session_id):
+            return None
+        return self.session_dir / f"{session_id}.json"
+
+    def create(self) -> ChatSession:
+        self._prune_expired()
+        return ChatSession(secrets.token_urlsafe(18))
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """Retourne la session si elle existe et n'a pas expiré"""
+        path = self._path(session_id)
+        if path is None:
+            return None
+        try:
+            with open(path, 'r') as f:
+                session = ChatSession.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+        if time.time() - session.updated_at > self.ttl:
+            return None
+        return session
+
+    def save(self, session: ChatSession):
+        """Écriture atomique de la session (0600)"""
+        path = self._path(session.id)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with self._lock:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(session.to_dict(), f)
+            os.replace(tmp_path, path)
+
+    def delete(self, session_id: str):
+        path = self._path(session_id)
+        if path is not None:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _prune_expired(self):
+        cutoff = time.time() - self.ttl
+        try:
+            for path in self.session_dir.glob('*.json'):
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+        except OSError:
+            pass
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from utils.resilience import CircuitOpenError, UpstreamError
+
+try:
+    import fcntl
+except ImportError:  # Windows : coalescence limitée aux threads du processus
+    fcntl = None
+
+# Configuration
+SINGLEFLIGHT_LOCK_DIR = os.getenv('SINGLEFLIGHT_LOCK_DIR')
+# Attente maximale du verrou d'un autre worker avant d'appeler l'amont directement
+SINGLEFLIGHT_MAX_WAIT_SECONDS = float(os.getenv('SINGLEFLIGHT_MAX_WAIT_SECONDS', '30'))
+LOCK_POLL_SECONDS = 0.05
+STALE_FILE_SECONDS = 3600
+
+
+def request_key(*parts) -> str:
+    """Clé de coalescence : hash SHA-256 des éléments de la requête (prompt, image, modèle...)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            digest.update(part)
+        elif isinstance(part, str):
+            digest.update(part.encode('utf-8'))
+        else:
+            digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class _Call:
+    """Appel amont en cours, partagé entre le thread meneur et ses suiveurs"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalescence des appels identiques en vol : un seul appel amont, résultat partagé.
+
+    Entre threads via un dictionnaire d'appels en cours ; entre workers (optionnel)
+    via des verrous `flock` et un fichier résultat dans `lock_dir`.
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None, max_wait: float = SINGLEFLIGHT_MAX_WAIT_SECONDS):
+        self._lock = threading.Lock()
+        self.max_wait = max_wait
+        self._calls: Dict[str, _Call] = {}
+        self.lock_dir = Path(lock_dir) if lock_dir and fcntl is not None else None
+        if self.lock_dir is not None:
+            self.lock_dir.mkdir(parents=True, exist_ok=True)
+        self.leader_calls = 0
+        self.coalesced_calls = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Exécute `fn` une seule fois pour tous les appelants concurrents de même clé"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leader_calls += 1
+            else:
+                self.coalesced_calls += 1
+
+        if not leader:
+            print(f"🔗 Appel coalescé {key[:8]}...")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if self.lock_dir is not None:
+                call.result = self._do_across_workers(key, fn)
+            else:
+                call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def _do_across_workers(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Un seul worker appelle l'amont ; les autres attendent le verrou (borné) et lisent son
+        résultat, ou son échec : les suiveurs ne rejouent pas l'appel l'un après l'autre."""
+        lock_path = self.lock_dir / f"{key}.lock"
+        result_path = self.lock_dir / f"{key}.json"
+        waiting_since = time.time()
+        give_up_at = time.monotonic() + self.max_wait
+        with open(lock_path, 'a') as lock_file:
+            os.utime(lock_path)
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    # Seul un résultat produit pendant notre attente est partagé : ce n'est pas un cache
+                    shared = self._read_shared_result(result_path, waiting_since)
+                    if shared is not None:
+                        return self._use_shared_result(key, shared)
+                    if time.monotonic() >= give_up_at:
+                        print(f"⏱️ Attente du worker meneur dépassée {key[:8]}..., appel direct")
+                        return fn()
+                    time.sleep(LOCK_POLL_SECONDS)
+            try:
+                shared = self._read_shared_result(result_path, waiting_since)
+                if shared is not None:
+                    return self._use_shared_result(key, shared)
+                try:
+                    result = fn()
+                except Exception as e:
+                    self._write_shared_result(result_path, {'error': {
+                        # Circuit ouvert : les suiveurs répondent aussi 503 avec Retry-After
+                        'kind': 'circuit_open' if isinstance(e, CircuitOpenError) else 'upstream',
+                        'circuit': getattr(e, 'name', None),
+                        'message': str(e),
+                        'status': getattr(e, 'status', None),
+                        'retry_after': getattr(e, 'retry_after', None)
+                    }})
+                    raise
+                self._write_shared_result(result_path, {'result': result})
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self._prune_stale_files()
+
+    def _use_shared_result(self, key: str, shared: Dict) -> Any:
+        """Résultat du worker meneur ; son échec est relevé tel quel plutôt que rejoué"""
+        self.coalesced_calls += 1
+        error = shared.get('error')
+        if error is not None:
+            print(f"🔗 Échec partagé entre workers {key[:8]}...")
+            if error.get('kind') == 'circuit_open':
+                raise CircuitOpenError(error.get('circuit') or 'amont', error.get('retry_after') or 1.0)
+            raise UpstreamError(error['message'], status=error.get('status'),
+                                retry_after=error.get('retry_after'))
+        print(f"🔗 Appel coalescé entre workers {key[:8]}...")
+        return shared['result']
+
+    def _read_shared_result(self, result_path: Path, not_before: float) -> Optional[Dict]:
+        try:
+            with open(result_path, 'r') as f:
+                shared = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if shared.get('completed_at', 0) < not_before:
+            return None
+        return shared
+
+    def _write_shared_result(self, result_path: Path, outcome: Dict):
+        """Écriture atomique du résultat ou du marqueur d'échec (seuls les résultats sérialisables)"""
+        try:
+            payload = json.dumps(dict(outcome, completed_at=time.time()))
+        except (TypeError, ValueError):
+            return
+        tmp_path = result_path.with_name(f"{result_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            f.write(payload)
+        os.replace(tmp_path, result_path)
+
+    def _prune_stale_files(self):
+        # Au pire, supprimer un verrou encore ouvert provoque un appel amont en double
+        cutoff = time.time() - STALE_FILE_SECONDS
+        try:
+            for path in self.lock_dir.iterdir():
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+        except OSError:
+            pass
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques de coalescence"""
+        with self._lock:
+            in_flight = len(self._calls)
+        return {
+            'leader_calls': self.leader_calls,
+            'coalesced_calls': self.coalesced_calls,
+            'in_flight': in_flight
+        }
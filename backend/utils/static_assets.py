@@ -0,0 +1,221 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+from flask import abort, make_response, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # Optionnel : seules les variantes gzip sont générées
+    brotli = None
+
+# Configuration
+MANIFEST_NAME = 'asset-manifest.json'
+COMPRESSIBLE_EXTENSIONS = ('.js', '.css', '.html', '.json', '.svg', '.txt')
+COMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+HASH_LENGTH = 16
+
+# Références locales dans le HTML (src="..." / href="...") à versionner
+_LOCAL_REF_RE = re.compile(r'(\s(?:src|href)=")(?!https?:|//|#|mailto:|data:)([^"?#]+)(")')
+
+
+def _file_hash(path: Path) -> str:
+    """Hash SHA-256 (tronqué) du contenu d'un fichier"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def _is_compressed_variant(path: Path) -> bool:
+    return path.suffix in COMPRESSED_SUFFIXES.values() and path.with_suffix('').suffix != ''
+
+
+def build_manifest(static_dir: Path, compress: bool = True) -> Dict:
+    """Calcule le manifeste des assets (hash de contenu) et génère les variantes pré-compressées.
+
+    À lancer au build : `python -m utils.static_assets` depuis `backend/`.
+    """
+    static_dir = Path(static_dir)
+    manifest = {}
+    for path in sorted(static_dir.rglob('*')):
+        if not path.is_file() or path.name == MANIFEST_NAME or _is_compressed_variant(path):
+            continue
+        rel_path = path.relative_to(static_dir).as_posix()
+        stat = path.stat()
+        entry = {
+            'hash': _file_hash(path),
+            'size': stat.st_size,
+            # Signature du fichier haché : une entrée périmée (fichier modifié depuis) est ignorée
+            'mtime_ns': stat.st_mtime_ns,
+            'encodings': []
+        }
+        if compress and path.suffix.lower() in COMPRESSIBLE_EXTENSIONS:
+            data = path.read_bytes()
+            variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants['br'] = brotli.compress(data, quality=11)
+            for encoding, compressed in variants.items():
+                # Inutile de servir une variante plus lourde que l'original
+                if len(compressed) >= len(data):
+                    continue
+                variant_path = path.with_name(path.name + COMPRESSED_SUFFIXES[encoding])
+                variant_path.write_bytes(compressed)
+                entry['encodings'].append(encoding)
+        manifest[rel_path] = entry
+
+    with open(static_dir / MANIFEST_NAME, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    print(f"✅ Manifeste assets généré: {len(manifest)} fichiers")
+    return manifest
+
+
+class StaticAssets:
+    """Service des fichiers statiques avec ETag fort, cache immutable et variantes pré-compressées"""
+
+    def __init__(self, static_dir: Path):
+        self.static_dir = Path(static_dir)
+        self.manifest = self._load_manifest()
+        # Hashes calculés à la volée pour les fichiers absents du manifeste (dev)
+        self._runtime_hashes = {}
+        self._html_cache = {}
+
+    def _load_manifest(self) -> Dict:
+        """Charge le manifeste précalculé s'il existe"""
+        try:
+            manifest_path = self.static_dir / MANIFEST_NAME
+            if manifest_path.exists():
+                with open(manifest_path, 'r') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"Erreur chargement manifeste assets: {e}")
+        return {}
+
+    def lookup(self, rel_path: str) -> Optional[Dict]:
+        """Retourne l'entrée du manifeste (hash, encodages) d'un asset.
+
+        L'entrée n'est utilisée que si le fichier n'a pas changé depuis le build (taille, mtime) ;
+        sinon le hash est recalculé et les variantes pré-compressées, périmées, sont ignorées.
+        """
+        path = self.static_dir / rel_path
+        try:
+            path.resolve().relative_to(self.static_dir.resolve())
+            stat = path.stat()
+        except (ValueError, OSError):
+            return None
+        if not path.is_file():
+            return None
+        entry = self.manifest.get(rel_path)
+        if entry is not None and entry['size'] == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            return entry
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._runtime_hashes.get(rel_path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, {'hash': _file_hash(path), 'size': stat.st_size, 'encodings': []})
+            self._runtime_hashes[rel_path] = cached
+        return cached[1]
+
+    def preload(self) -> int:
+        """Calcule d'avance les hashes des fichiers absents du manifeste (master Gunicorn)"""
+        count = 0
+        for path in self.static_dir.rglob('*'):
+            if path.is_file() and not _is_compressed_variant(path) and path.name != MANIFEST_NAME:
+                self.lookup(path.relative_to(self.static_dir).as_posix())
+                count += 1
+        return count
+
+    def asset_url(self, rel_path: str) -> str:
+        """URL empreintée (`?v=<hash>`) d'un asset, servie avec un cache immutable"""
+        entry = self.lookup(rel_path)
+        if entry is None:
+            return rel_path
+        return f"{rel_path}?v={entry['hash']}"
+
+    def _negotiate_encoding(self, entry: Dict) -> Optional[str]:
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in entry['encodings'] and accepted[encoding]:
+                return encoding
+        return None
+
+    def send(self, rel_path: str):
+        """Sert un asset (requêtes Range et conditionnelles gérées par Werkzeug)"""
+        # Sorties du build : le manifeste et les variantes compressées ne sont pas des assets publics
+        if Path(rel_path).name == MANIFEST_NAME or _is_compressed_variant(Path(rel_path)):
+            abort(404)
+        entry = self.lookup(rel_path)
+        if entry is None:
+            return send_from_directory(str(self.static_dir), rel_path)
+
+        encoding = self._negotiate_encoding(entry)
+        filename = rel_path + COMPRESSED_SUFFIXES[encoding] if encoding else rel_path
+        etag = f"{entry['hash']}-{encoding}" if encoding else entry['hash']
+        mimetype = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+        fingerprinted = request.args.get('v') == entry['hash']
+
+        # Sans empreinte : `no-cache`, le navigateur revalide via l'ETag (304)
+        response = send_from_directory(
+            str(self.static_dir),
+            filename,
+            mimetype=mimetype,
+            etag=etag,
+            max_age=IMMUTABLE_MAX_AGE if fingerprinted else None
+        )
+        if fingerprinted:
+            response.cache_control.immutable = True
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if entry['encodings']:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    def send_html(self, rel_path: str):
+        """Sert une page HTML dont les références locales pointent vers les URLs empreintées"""
+        entry = self.lookup(rel_path)
+        if entry is None:
+            return send_from_directory(str(self.static_dir), rel_path)
+
+        # Clé : hash de la page et des assets qu'elle référence (un app.js modifié change la page)
+        cached = self._html_cache.get(rel_path)
+        if cached is None or cached[0] != self._html_signature(entry, cached[1]):
+            html = (self.static_dir / rel_path).read_text(encoding='utf-8')
+            base_dir = os.path.dirname(rel_path)
+            targets = []
+
+            def _versioned(match):
+                ref = match.group(2)
+                target = os.path.normpath(os.path.join(base_dir, ref)).replace(os.sep, '/')
+                target_entry = self.lookup(target)
+                if target_entry is None:
+                    return match.group(0)
+                targets.append(target)
+                return f"{match.group(1)}{ref}?v={target_entry['hash']}{match.group(3)}"
+
+            body = _LOCAL_REF_RE.sub(_versioned, html).encode('utf-8')
+            cached = (self._html_signature(entry, targets), targets, body,
+                      hashlib.sha256(body).hexdigest()[:HASH_LENGTH])
+            self._html_cache[rel_path] = cached
+
+        response = make_response(cached[2])
+        response.mimetype = 'text/html'
+        response.set_etag(cached[3])
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    def _html_signature(self, entry: Dict, targets) -> tuple:
+        hashes = []
+        for target in targets:
+            target_entry = self.lookup(target)
+            hashes.append(target_entry['hash'] if target_entry else None)
+        return (entry['hash'], tuple(hashes))
+
+
+if __name__ == '__main__':
+    build_manifest(Path(__file__).resolve().parent.parent.parent / 'static')
@@ -1,15 +1,18 @@
-import requests
 import base64
 import hashlib
 import json
 import time
 import os
+import threading
 from pathlib import Path
-from PIL import Image
 import io
 from functools import lru_cache
 from typing import Dict, List, Optional
 
+from utils.singleflight import SINGLEFLIGHT_LOCK_DIR, SingleFlight, request_key
+from utils.resilience import OPENROUTER_CHAT_URL, openrouter_client
+from utils.routing import MODEL_TIERS, route_vision
+
 # Configuration
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -22,13 +25,21 @@ class VisionAnalyzer:
         self.cache = self._load_cache()
         self.api_calls_count = 0
         self.api_calls_cost = 0  
+        self._cache_lock = threading.Lock()
+        # Analyses concurrentes d'une même image : un seul appel API
+        self._inflight = SingleFlight(SINGLEFLIGHT_LOCK_DIR)
     
     def _load_cache(self) -> Dict:
         """Charge le cache depuis le fichier"""
         try:
             if os.path.exists(VISION_CACHE_FILE):
                 with open(VISION_CACHE_FILE, 'r') as f:
-                    return json.load(f)
+                    cache = json.load(f)
+                # Purge des messages d'erreur mis en cache par d'anciennes versions
+                return {
+                    key: entry for key, entry in cache.items()
+                    if not str(entry.get('result', '')).startswith('❌')
+                }
         except Exception as e:
             print(f"Erreur chargement cache: {e}")
         return {}
@@ -36,16 +47,27 @@ class VisionAnalyzer:
     def _save_cache(self):
         """Sauvegarde le cache dans le fichier"""
         try:
-            with open(VISION_CACHE_FILE, 'w') as f:
-                json.dump(self.cache, f, indent=2)
+            with self._cache_lock:
+                with open(VISION_CACHE_FILE, 'w') as f:
+                    json.dump(self.cache, f, indent=2)
         except Exception as e:
             print(f"Erreur sauvegarde cache: {e}")
+
+    def _store_result(self, cache_key: str, result: str, size: int):
+        """Met un résultat en cache et persiste le fichier"""
+        with self._cache_lock:
+            self.cache[cache_key] = {
+                'result': result,
+                'timestamp': time.time(),
+                'size': size
+            }
+        self._save_cache()
     
     def _get_cache_key(self, image_bytes: bytes) -> str:
         """Génère une clé de cache basée sur le hash de l'image"""
         return hashlib.md5(image_bytes).hexdigest()
     
-    def describe_image(self, image_bytes: bytes, context: str = "") -> str:
+    def describe_image(self, image_bytes: bytes, context: str = "", kind: str = "image") -> str:
         """Analyse une image avec cache et gestion d'erreurs robuste"""
         try:
             # Vérifier le cache
@@ -54,27 +76,38 @@ class VisionAnalyzer:
                 print(f"📋 Cache hit pour image {cache_key[:8]}...")
                 return self.cache[cache_key]['result']
             
-            # Optimiser l'image
-            optimized_image = self._optimize_image_for_api(image_bytes)
-            if not optimized_image:
-                return "❌ Erreur: Impossible d'optimiser l'image"
-            
-            # Appel API avec retry
-            result = self._call_vision_api_with_retry(optimized_image, context)
-            
-            # Mettre en cache
-            self.cache[cache_key] = {
-                'result': result,
-                'timestamp': time.time(),
-                'size': len(image_bytes)
-            }
-            self._save_cache()
-            
+            # Les appels concurrents pour la même image et le même prompt attendent le premier
+            result = self._inflight.do(
+                request_key(cache_key, context, kind),
+                lambda: self._analyze_and_cache(cache_key, image_bytes, context, kind)
+            )
+            # Résultat produit par un autre worker : mis en cache ici aussi, sinon le prochain
+            # _save_cache de ce worker l'effacerait du fichier
+            if cache_key not in self.cache and not result.startswith('❌'):
+                self._store_result(cache_key, result, len(image_bytes))
             return result
             
         except Exception as e:
             print(f"Erreur analyse vision: {e}")
             return f"❌ Erreur analyse vision: {str(e)}"
+
+    def _analyze_and_cache(self, cache_key: str, image_bytes: bytes, context: str, kind: str = "image") -> str:
+        """Optimise, analyse puis met en cache une image (appel meneur)"""
+        # Un appel concurrent a pu remplir le cache entre-temps
+        if cache_key in self.cache:
+            return self.cache[cache_key]['result']
+
+        # Optimiser l'image
+        optimized_image = self._optimize_image_for_api(image_bytes)
+        if not optimized_image:
+            return "❌ Erreur: Impossible d'optimiser l'image"
+
+        # Appel API avec retry
+        result = self._call_vision_api_with_retry(optimized_image, context, kind)
+
+        # Mettre en cache
+        self._store_result(cache_key, result, len(image_bytes))
+        return result
     
     def describe_chart(self, image_bytes: bytes) -> str:
         """Analyse spécialisée pour les graphiques/charts"""
@@ -89,7 +122,7 @@ class VisionAnalyzer:
         Réponds en français de manière structurée avec des emojis pour la lisibilité.
         """
         
-        return self.describe_image(image_bytes, chart_prompt)
+        return self.describe_image(image_bytes, chart_prompt, kind="chart")
     
     def describe_table(self, image_bytes: bytes) -> str:
         """Analyse spécialisée pour les tableaux"""
@@ -104,10 +137,12 @@ class VisionAnalyzer:
         Présente les données de manière claire et structurée.
         """
         
-        return self.describe_image(image_bytes, table_prompt)
+        return self.describe_image(image_bytes, table_prompt, kind="table")
     
     def _optimize_image_for_api(self, image_bytes: bytes, max_size_kb: int = 800) -> Optional[bytes]:
         """Optimise une image pour l'API vision"""
+        from PIL import Image  # Import différé : Pillow n'est chargé qu'à la première image
+
         try:
             img = Image.open(io.BytesIO(image_bytes))
             
@@ -136,8 +171,10 @@ class VisionAnalyzer:
             print(f"Erreur optimisation image: {e}")
             return None
     
-    def _call_vision_api_with_retry(self, image_bytes: bytes, context: str = "") -> str:
-        """Appel API vision avec retry et gestion d'erreurs"""
+    def _call_vision_api_with_retry(self, image_bytes: bytes, context: str = "", kind: str = "image") -> str:
+        """Appel API vision via le client résilient partagé (retries, disjoncteur)"""
+        # Graphiques/tableaux : modèle vision fort ; images génériques : modèle rapide
+        tier = MODEL_TIERS[route_vision(kind)]
         base64_image = base64.b64encode(image_bytes).decode('utf-8')
         
         # Prompt par défaut si pas de contexte
@@ -158,7 +195,7 @@ class VisionAnalyzer:
         }
         
         data = {
-            "model": "anthropic/claude-3-5-sonnet",
+            "model": tier['model'],
             "messages": [
                 {
                     "role": "user",
@@ -173,62 +210,36 @@ class VisionAnalyzer:
                     ]
                 }
             ],
-            "max_tokens": 1000
+            "max_tokens": tier['max_tokens']
         }
         
-        for attempt in range(MAX_RETRIES):
-            try:
-                print(f"🔄 Appel API vision (tentative {attempt + 1}/{MAX_RETRIES})...")
-                
-                response = requests.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers=headers,
-                    json=data,
-                    timeout=REQUEST_TIMEOUT
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()['choices'][0]['message']['content']
-                    self.api_calls_count += 1
-                    print(f"✅ API vision réussie (appel #{self.api_calls_count})")
-                    return result
-                else:
-                    print(f"❌ Erreur API: {response.status_code} - {response.text}")
-                    if attempt < MAX_RETRIES - 1:
-                        time.sleep(2 ** attempt)  # Backoff exponentiel
-                        continue
-                    else:
-                        return f"❌ Erreur API après {MAX_RETRIES} tentatives: {response.text}"
-                        
-            except requests.exceptions.Timeout:
-                print(f"⏰ Timeout API (tentative {attempt + 1})")
-                if attempt < MAX_RETRIES - 1:
-                    time.sleep(2 ** attempt)
-                    continue
-                else:
-                    return "❌ Timeout API après plusieurs tentatives"
-                    
-            except Exception as e:
-                print(f"❌ Erreur inattendue: {e}")
-                if attempt < MAX_RETRIES - 1:
-                    time.sleep(2 ** attempt)
-                    continue
-                else:
-                    return f"❌ Erreur inattendue: {str(e)}"
-        
-        return "❌ Échec de l'analyse vision"
+        print(f"🔄 Appel API vision (jusqu'à {MAX_RETRIES} tentatives)...")
+        # Lève UpstreamError en cas d'échec : une erreur n'est jamais mise en cache
+        body = openrouter_client.post_json(
+            OPENROUTER_CHAT_URL,
+            headers,
+            data,
+            timeout=tier.get('timeout', REQUEST_TIMEOUT),
+            max_retries=MAX_RETRIES
+        )
+        result = body['choices'][0]['message']['content']
+        self.api_calls_count += 1
+        print(f"✅ API vision réussie (appel #{self.api_calls_count})")
+        return result
     
     def get_stats(self) -> Dict:
         """Retourne les statistiques d'utilisation"""
         return {
             'api_calls': self.api_calls_count,
+            'coalesced_calls': self._inflight.coalesced_calls,
             'cache_size': len(self.cache),
             'cache_hits': sum(1 for v in self.cache.values() if 'result' in v)
         }
     
     def clear_cache(self):
         """Vide le cache"""
-        self.cache = {}
+        with self._cache_lock:
+            self.cache = {}
         self._save_cache()
         print("🗑️ Cache vision vidé")
     
@@ -245,12 +256,7 @@ class VisionAnalyzer:
             
             # Mettre en cache le nouveau résultat
             cache_key = self._get_cache_key(image_bytes)
-            self.cache[cache_key] = {
-                'result': result,
-                'timestamp': time.time(),
-                'size': len(image_bytes)
-            }
-            self._save_cache()
+            self._store_result(cache_key, result, len(image_bytes))
             
             return result
             
@@ -258,30 +264,49 @@ class VisionAnalyzer:
             print(f"Erreur analyse vision forcée: {e}")
             return f"❌ Erreur analyse vision: {str(e)}"
 
-# Instance globale
-vision_analyzer = VisionAnalyzer()
+# Instance globale, créée au premier usage : l'import ne lit pas le cache
+_vision_analyzer = None
+_vision_analyzer_lock = threading.Lock()
+
+
+def get_vision_analyzer() -> VisionAnalyzer:
+    """Retourne l'instance globale (chargement paresseux du cache)"""
+    global _vision_analyzer
+    if _vision_analyzer is None:
+        with _vision_analyzer_lock:
+            if _vision_analyzer is None:
+                _vision_analyzer = VisionAnalyzer()
+    return _vision_analyzer
+
+
+def __getattr__(name):
+    # Compatibilité : `from utils.vision import vision_analyzer`
+    if name == 'vision_analyzer':
+        return get_vision_analyzer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Fonctions d'interface pour compatibilité
 def describe_image(image_bytes: bytes) -> str:
     """Interface simple pour analyse d'image"""
-    return vision_analyzer.describe_image(image_bytes)
+    return get_vision_analyzer().describe_image(image_bytes)
 
 def describe_chart(image_bytes: bytes) -> str:
     """Interface pour analyse de graphiques"""
-    return vision_analyzer.describe_chart(image_bytes)
+    return get_vision_analyzer().describe_chart(image_bytes)
 
 def describe_table(image_bytes: bytes) -> str:
     """Interface pour analyse de tableaux"""
-    return vision_analyzer.describe_table(image_bytes)
+    return get_vision_analyzer().describe_table(image_bytes)
 
 def get_vision_stats() -> Dict:
     """Retourne les stats de vision"""
-    return vision_analyzer.get_stats()
+    return get_vision_analyzer().get_stats()
 
 def force_new_vision_analysis(image_bytes: bytes) -> str:
     """Force une nouvelle analyse vision en ignorant le cache"""
-    return vision_analyzer.force_new_analysis(image_bytes)
+    return get_vision_analyzer().force_new_analysis(image_bytes)
 
 def clear_vision_cache():
     """Vide le cache vision"""
-    vision_analyzer.clear_cache() 
\ No newline at end of file
+    get_vision_analyzer().clear_cache() 
\ No newline at end of file
@@ -1,4 +1,7 @@
-from app import app
+from utils.preload import startup_report
+
+with startup_report.phase('import app'):
+    from app import app
 
 if __name__ == "__main__":
-    app.run() 
\ No newline at end of file
+    app.run() 
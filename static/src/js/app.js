@@ -13,6 +13,8 @@ class FinAssistCopilot {
         this.zoomStep = 0.2;
         this.split = null;
         this.contextDocs = [];
+        this.sessionId = null; // Session de chat côté serveur
+        this.sessionDocsKey = null; // Documents déjà envoyés dans cette session
         this.pagesRendered = 0; // <--- Ajouté pour le rendu progressif
         this.pagesPerBatch = 2; // <--- Nombre de pages à charger à chaque scroll
         this.initialPages = 3; // <--- Nombre de pages au début
@@ -106,50 +108,55 @@ class FinAssistCopilot {
                 return;
             }
 
-            // Préparer les fichiers à envoyer
-            const formData = new FormData();
-            formData.append('question', message);
-            let hasValidFile = false;
-            for (const doc of this.contextDocs) {
-                if (doc.isLocal) {
-                    let fileToSend = doc._file;
-                    if (!fileToSend) {
-                        // Si _file absent (après refresh), on le récupère depuis IndexedDB
-                        fileToSend = await getPDF(doc.id);
-                    }
-                    if (fileToSend) {
-                        formData.append('files', fileToSend, doc.name);
-                        hasValidFile = true;
-                    } else {
-                        this.removeTypingIndicator();
-                        this.addChatMessage('ai', `❌ The local file "${doc.name}" is not available anymore. Please re-upload it.`);
-                    }
-                } else if (doc.filename) {
-                    try {
-                        const response = await fetch(doc.filename);
-                        const blob = await response.blob();
-                        let fileName = doc.name;
-                        if (!fileName.toLowerCase().endsWith('.pdf')) {
-                            fileName = (doc.filename.split('/').pop() || 'document.pdf');
+            // Les documents ne sont renvoyés que si le contexte a changé depuis le dernier tour
+            const docsKey = this.contextDocs.map(doc => doc.id).join('|');
+            const buildFormData = async (withDocuments) => {
+                const formData = new FormData();
+                formData.append('question', message);
+                if (this.sessionId) formData.append('session_id', this.sessionId);
+                if (!withDocuments) return formData;
+                let hasValidFile = false;
+                for (const doc of this.contextDocs) {
+                    if (doc.isLocal) {
+                        let fileToSend = doc._file;
+                        if (!fileToSend) {
+                            // Si _file absent (après refresh), on le récupère depuis IndexedDB
+                            fileToSend = await getPDF(doc.id);
                         }
-                        formData.append('files', blob, fileName);
+                        if (fileToSend) {
+                            formData.append('files', fileToSend, doc.name);
+                            hasValidFile = true;
+                        } else {
+                            this.removeTypingIndicator();
+                            this.addChatMessage('ai', `❌ The local file "${doc.name}" is not available anymore. Please re-upload it.`);
+                        }
+                    } else if (doc.filename) {
+                        // Document statique : le backend le lit sur disque, inutile de le re-télécharger
+                        const staticPath = doc.filename.split('?')[0].replace(/^\//, '');
+                        formData.append('static_files', staticPath);
                         hasValidFile = true;
-                    } catch (e) {
-                        this.removeTypingIndicator();
-                        this.addChatMessage('ai', `❌ Could not fetch static document "${doc.name}".`);
                     }
                 }
-            }
-            if (!hasValidFile) {
+                return hasValidFile ? formData : null;
+            };
+
+            let formData = await buildFormData(!this.sessionId || this.sessionDocsKey !== docsKey);
+            if (!formData) {
                 this.removeTypingIndicator();
                 return;
             }
             // Appel au backend
             try {
-                const resp = await fetch('/ask', {
+                let resp = await fetch('/ask', {
                     method: 'POST',
                     body: formData
                 });
+                if (resp.status === 409) {
+                    // Session expirée côté serveur : on repart avec les documents
+                    this.sessionId = null;
+                    formData = await buildFormData(true);
+                    resp = formData ? await fetch('/ask', { method: 'POST', body: formData }) : resp;
+                }
                 this.removeTypingIndicator();
                 if (!resp.ok) {
                     const data = await resp.json().catch(() => ({}));
@@ -157,6 +164,10 @@ class FinAssistCopilot {
                     this.addChatMessage('ai', `❌ Error: ${data.error || 'Server error.'}${extra}`);
                 } else {
                     const data = await resp.json();
+                    if (data.session_id) {
+                        this.sessionId = data.session_id;
+                        this.sessionDocsKey = docsKey;
+                    }
                     this.addChatMessage('ai', data.answer || 'No answer received.');
                 }
             } catch (err) {
@@ -278,7 +289,11 @@ class FinAssistCopilot {
     
     async loadRealPDF(doc) {
         try {
-            const loadingTask = pdfjsLib.getDocument(doc.filename);
+            // Documents servis par le backend : chargement progressif via requêtes Range
+            const source = doc.isLocal
+                ? doc.filename
+                : { url: doc.filename, disableAutoFetch: true, disableStream: true };
+            const loadingTask = pdfjsLib.getDocument(source);
             const pdf = await loadingTask.promise;
             this.currentPdf = pdf;
             this.pagesRendered = 0; // <--- Reset ici aussi